@@ -1,6 +1,7 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, session, flash, abort
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, session, flash, abort, Response, stream_with_context
 from models import db, Course, Faculty, Room, Student, TimeSlot, TimetableEntry, User, PeriodConfig, BreakConfig, StudentGroup
 from scheduler import TimetableGenerator
+from jobs import GenerationQueue, FINISHED, INCREMENTAL
 from functools import wraps
 import csv
 import io
@@ -8,6 +9,7 @@ from datetime import datetime
 import json
 import secrets
 import math
+import time
 
 import pandas as pd
 from pymongo.errors import DuplicateKeyError as IntegrityError
@@ -268,6 +270,7 @@ app.config['MONGO_DBNAME'] = 'timetable'
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
 # Initialize our MongoDB-backed db compatibility layer
 db.init_app(app)
+generation_queue = GenerationQueue(db)
 
 # Inject `next_page` into all templates based on a fixed navigation order.
 @app.context_processor
@@ -633,19 +636,13 @@ def import_courses():
 def delete_all_courses():
     """Delete all courses"""
     try:
-        # Get all courses
-        all_courses = Course.query.all()
-        deleted_count = 0
+        # Delete server-side by id instead of loading every course
+        course_ids = Course.query.scalars('id')
         
-        for course in all_courses:
-            # Remove timetable entries referencing this course
-            TimetableEntry.query.filter_by(course_id=course.id).delete(synchronize_session=False)
-            
-            # Delete course record
-            db.session.delete(course)
-            deleted_count += 1
+        # Remove timetable entries referencing these courses
+        TimetableEntry.query.filter(TimetableEntry.course_id.in_(course_ids)).delete(synchronize_session=False)
         
-        db.session.commit()
+        deleted_count = Course.query.filter(Course.id.in_(course_ids)).delete(synchronize_session=False)
         return jsonify({'success': True, 'deleted': deleted_count})
     except Exception as e:
         db.session.rollback()
@@ -713,8 +710,22 @@ def update_own_availability():
     elif not isinstance(availability_payload, str):
         availability_payload = '{}'
     faculty.availability = availability_payload
+    db.session.add(faculty)
     db.session.commit()
-    return jsonify({'success': True, 'message': f'Availability saved successfully ({percentage:.1f}% available)'})
+
+    # Repair the stored timetable around the new availability in the background,
+    # queued behind any running generation
+    response = {'success': True, 'message': f'Availability saved successfully ({percentage:.1f}% available)'}
+    if TimetableEntry.query.count():
+        try:
+            job = generation_queue.submit(requested_by=user.id, kind=INCREMENTAL,
+                                          params={'faculty_ids': [faculty.id]})
+        except Exception as e:
+            response['warnings'] = [f'Timetable update could not be queued: {e}']
+        else:
+            response['timetable_repair_job'] = job.id
+            response['message'] += '. The timetable will be updated around it shortly.'
+    return jsonify(response)
 
 @app.route('/faculty/import', methods=['POST'])
 @admin_required
@@ -783,25 +794,19 @@ def import_faculty():
 def delete_all_faculty():
     """Delete all faculty members and their linked user accounts"""
     try:
-        # Get all faculty
-        all_faculty = Faculty.query.all()
-        deleted_count = 0
+        # Delete server-side by id instead of loading every faculty member
+        faculty_rows = Faculty.query.values('id', 'user_id')
+        faculty_ids = [faculty_id for faculty_id, _ in faculty_rows]
+        user_ids = [user_id for _, user_id in faculty_rows if user_id]
         
-        for faculty in all_faculty:
-            # Remove linked user account if exists
-            if faculty.user_id:
-                user = User.query.get(faculty.user_id)
-                if user and user.role == 'teacher':
-                    db.session.delete(user)
-            
-            # Remove timetable entries referencing this faculty
-            TimetableEntry.query.filter_by(faculty_id=faculty.id).delete(synchronize_session=False)
-            
-            # Delete faculty record
-            db.session.delete(faculty)
-            deleted_count += 1
+        # Remove linked teacher accounts
+        if user_ids:
+            User.query.filter(User.id.in_(user_ids), User.role == 'teacher').delete(synchronize_session=False)
         
-        db.session.commit()
+        # Remove timetable entries referencing these faculty
+        TimetableEntry.query.filter(TimetableEntry.faculty_id.in_(faculty_ids)).delete(synchronize_session=False)
+        
+        deleted_count = Faculty.query.filter(Faculty.id.in_(faculty_ids)).delete(synchronize_session=False)
         return jsonify({'success': True, 'deleted': deleted_count})
     except Exception as e:
         db.session.rollback()
@@ -928,19 +933,13 @@ def import_rooms():
 def delete_all_rooms():
     """Delete all rooms"""
     try:
-        # Get all rooms
-        all_rooms = Room.query.all()
-        deleted_count = 0
+        # Delete server-side by id instead of loading every room
+        room_ids = Room.query.scalars('id')
         
-        for room in all_rooms:
-            # Remove timetable entries referencing this room
-            TimetableEntry.query.filter_by(room_id=room.id).delete(synchronize_session=False)
-            
-            # Delete room record
-            db.session.delete(room)
-            deleted_count += 1
+        # Remove timetable entries referencing these rooms
+        TimetableEntry.query.filter(TimetableEntry.room_id.in_(room_ids)).delete(synchronize_session=False)
         
-        db.session.commit()
+        deleted_count = Room.query.filter(Room.id.in_(room_ids)).delete(synchronize_session=False)
         return jsonify({'success': True, 'deleted': deleted_count})
     except Exception as e:
         db.session.rollback()
@@ -1074,16 +1073,8 @@ def import_students():
 def delete_all_students():
     """Delete all students"""
     try:
-        # Get all students
-        all_students = Student.query.all()
-        deleted_count = 0
-        
-        for student in all_students:
-            # Delete student record
-            db.session.delete(student)
-            deleted_count += 1
-        
-        db.session.commit()
+        # One server-side delete instead of loading every student
+        deleted_count = Student.query.delete(synchronize_session=False)
         return jsonify({'success': True, 'deleted': deleted_count})
     except Exception as e:
         db.session.rollback()
@@ -1237,16 +1228,8 @@ def import_student_groups():
 def delete_all_student_groups():
     """Delete all student groups"""
     try:
-        # Get all student groups
-        all_groups = StudentGroup.query.all()
-        deleted_count = 0
-        
-        for group in all_groups:
-            # Delete student group record
-            db.session.delete(group)
-            deleted_count += 1
-        
-        db.session.commit()
+        # One server-side delete instead of loading every student group
+        deleted_count = StudentGroup.query.delete(synchronize_session=False)
         return jsonify({'success': True, 'deleted': deleted_count})
     except Exception as e:
         db.session.rollback()
@@ -1272,9 +1255,12 @@ def timetable():
     # Filter entries to only include those with valid time_slot_id
     entries = [e for e in entries_query.all() if e.time_slot_id in valid_slot_ids]
 
-    courses_dict = {c.id: c for c in Course.query.all()}
-    faculty_dict = {f.id: f for f in Faculty.query.all()}
-    rooms_dict = {r.id: r for r in Room.query.all()}
+    # Only the fields the grid and the manual-assignment lists use; faculty
+    # availability JSON and the like stay in the database
+    courses_dict = {c.id: c for c in Course.query.only(
+        'code', 'name', 'credits', 'hours_per_week', 'course_type').all()}
+    faculty_dict = {f.id: f for f in Faculty.query.only('name', 'email', 'expertise').all()}
+    rooms_dict = {r.id: r for r in Room.query.only('name', 'capacity', 'room_type', 'tags').all()}
     
     # Get break configurations
     breaks = BreakConfig.query.order_by(BreakConfig.after_period).all()
@@ -1302,7 +1288,7 @@ def timetable():
     else:
         days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
     
-    periods = sorted(set(s.period for s in TimeSlot.query.all()))
+    periods = sorted(set(TimeSlot.query.scalars('period')))
     
     teacher_availability = {}
     if faculty_profile and faculty_profile.availability:
@@ -1343,7 +1329,7 @@ def timetable():
         })
 
     courses_list = []
-    for c in Course.query.all():
+    for c in courses_dict.values():
         courses_list.append({
             'id': getattr(c, 'id', None),
             'code': getattr(c, 'code', ''),
@@ -1354,7 +1340,7 @@ def timetable():
         })
 
     faculty_list = []
-    for f in Faculty.query.all():
+    for f in faculty_dict.values():
         faculty_list.append({
             'id': getattr(f, 'id', None),
             'name': getattr(f, 'name', ''),
@@ -1363,7 +1349,7 @@ def timetable():
         })
 
     rooms_list = []
-    for r in Room.query.all():
+    for r in rooms_dict.values():
         rooms_list.append({
             'id': getattr(r, 'id', None),
             'name': getattr(r, 'name', ''),
@@ -1404,9 +1390,7 @@ def timetable_entries():
 
     slots = TimeSlot.query.filter_by(day=day).all()
     slot_map = {s.id: s for s in slots}
-    # Mongo-backed Query object does not support SQLAlchemy-style .filter or in_ operations.
-    # Fetch all timetable entries and manually filter by matching time_slot_id.
-    entries = [e for e in TimetableEntry.query.all() if e.time_slot_id in slot_map]
+    entries = TimetableEntry.query.filter(TimetableEntry.time_slot_id.in_(slot_map)).all()
     result = []
     for e in entries:
         s = slot_map.get(e.time_slot_id)
@@ -1424,26 +1408,117 @@ def timetable_entries():
 @app.route('/timetable/generate', methods=['POST'])
 @admin_required
 def generate_timetable():
-    # Clear existing timetable
-    TimetableEntry.query.delete()
-    db.session.commit()
-    
-    # Generate new timetable
-    generator = TimetableGenerator(db)
-    result = generator.generate()
-    
+    # Generation runs as a background job; the existing timetable stays in place
+    # until the job succeeds and swaps in the new one
+    job = generation_queue.submit(requested_by=session.get('user_id'))
+    return jsonify({
+        'success': True,
+        'message': 'Timetable generation queued.',
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('timetable_job_status', job_id=job.id)
+    }), 202
+
+
+def _generation_response(result):
+    if result['success'] and 'entries_updated' in result:
+        changed = result['entries_created'] + result['entries_updated'] + result.get('entries_removed', 0)
+        return {
+            'success': True,
+            'message': f'Timetable repaired! {changed} entries changed.',
+            'kept_assignments': result.get('kept_assignments', 0),
+            'warnings': result.get('warnings', [])
+        }
     if result['success']:
-        return jsonify({
+        return {
             'success': True,
             'message': f'Timetable generated successfully! {result["entries_created"]} entries created.',
+            'kept_assignments': result.get('kept_assignments', 0),
+            'previous_entries': result.get('previous_entries', 0),
             'warnings': result.get('warnings', [])
-        })
-    else:
-        return jsonify({
-            'success': False,
-            'message': result.get('error', 'Failed to generate timetable'),
-            'warnings': result.get('warnings', [])
-        })
+        }
+    return {
+        'success': False,
+        'message': result.get('error', 'Failed to generate timetable'),
+        'warnings': result.get('warnings', [])
+    }
+
+
+def _job_payload(job):
+    payload = {
+        'job_id': job.id,
+        'status': job.status,
+        'created_at': getattr(job, 'created_at', None),
+        'started_at': getattr(job, 'started_at', None),
+        'finished_at': getattr(job, 'finished_at', None),
+        'progress': getattr(job, 'progress', None),
+    }
+    if job.status in FINISHED:
+        result = getattr(job, 'result', None) or {'success': False, 'error': 'Generation cancelled.'}
+        payload.update(_generation_response(result))
+    return payload
+
+
+@app.route('/timetable/jobs/<int:job_id>')
+@admin_required
+def timetable_job_status(job_id):
+    """Poll a generation job. "progress" is its latest progress event (phase,
+    incumbent/bound/gap during the ILP, GA generation and best fitness while refining);
+    finished jobs also carry the usual generate response.
+    """
+    job = generation_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found.'}), 404
+    return jsonify(_job_payload(job))
+
+
+@app.route('/timetable/jobs/<int:job_id>/stream')
+@admin_required
+def timetable_job_stream(job_id):
+    """Server-sent events for a generation job: each change of its status or
+    progress, ending with the finished job payload. A stream closes after the
+    queue's stream_window; EventSource clients reconnect to pick it up again.
+    """
+    if generation_queue.get(job_id) is None:
+        return jsonify({'success': False, 'message': 'Job not found.'}), 404
+
+    def events():
+        last = None
+        deadline = time.monotonic() + generation_queue.stream_window
+        yield f"retry: {int(generation_queue.poll_interval * 1000)}\n\n"
+        while time.monotonic() < deadline:
+            job = generation_queue.get(job_id)
+            if job is None:
+                return
+            payload = _job_payload(job)
+            if payload != last:
+                yield f"data: {json.dumps(payload)}\n\n"
+                last = payload
+            if job.status in FINISHED:
+                return
+            time.sleep(generation_queue.poll_interval)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/timetable/jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_timetable_job(job_id):
+    job = generation_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'No queued or running job with that id.'}), 404
+    return jsonify({'success': True, 'message': 'Cancellation requested.', 'status': job.status})
+
+
+@app.route('/timetable/jobs/<int:job_id>/accept', methods=['POST'])
+@admin_required
+def accept_timetable_job(job_id):
+    """Stop a running generation early and keep its best timetable so far"""
+    job = generation_queue.accept(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'No running job with that id.'}), 404
+    return jsonify({'success': True, 'message': 'Keeping the best timetable found so far.'})
 
 
 @app.route('/timetable/manual-save', methods=['POST'])
@@ -1473,7 +1548,7 @@ def manual_save_timetable():
     # Gather slots for this day and existing entries in those slots
     day_slots = TimeSlot.query.filter_by(day=day).all()
     day_slot_ids = {s.id for s in day_slots}
-    existing_entries = [e for e in TimetableEntry.query.all() if e.time_slot_id in day_slot_ids]
+    existing_entries = TimetableEntry.query.filter(TimetableEntry.time_slot_id.in_(day_slot_ids)).all()
 
     # Count existing assigned periods per group for the day (only count entries with a course)
     from collections import defaultdict as _dd
@@ -1535,18 +1610,21 @@ def manual_save_timetable():
 
         # Basic conflict checks: faculty or room already assigned at this timeslot to another group
         if faculty_id:
-            # Mongo Query does not support SQLAlchemy-style filter conditions; perform manual conflict check
-            existing_entries = TimetableEntry.query.all()
-            conflict = next((te for te in existing_entries
-                             if te.time_slot_id == slot.id and te.faculty_id == faculty_id and te.student_group != group_name), None)
+            conflict = TimetableEntry.query.filter(
+                TimetableEntry.time_slot_id == slot.id,
+                TimetableEntry.faculty_id == faculty_id,
+                TimetableEntry.student_group != group_name,
+            ).first()
             if conflict:
                 errors.append(f'Faculty id {faculty_id} is already assigned at {day} P{period} to {conflict.student_group}')
                 continue
 
         if room_id:
-            existing_entries = 'existing_entries' in locals() and existing_entries or TimetableEntry.query.all()
-            conflict = next((te for te in existing_entries
-                             if te.time_slot_id == slot.id and te.room_id == room_id and te.student_group != group_name), None)
+            conflict = TimetableEntry.query.filter(
+                TimetableEntry.time_slot_id == slot.id,
+                TimetableEntry.room_id == room_id,
+                TimetableEntry.student_group != group_name,
+            ).first()
             if conflict:
                 errors.append(f'Room id {room_id} is already used at {day} P{period} by {conflict.student_group}')
                 continue
@@ -1707,14 +1785,13 @@ def delete_break(break_id):
 def export_timetable():
     slots = TimeSlot.query.all()
     slots_dict = {s.id: s for s in slots}
-    valid_slot_ids = set(slots_dict.keys())
 
-    # Filter entries to only include those with valid time_slot_id
-    entries = [e for e in TimetableEntry.query.all() if e.time_slot_id in valid_slot_ids]
+    # Stream only entries with a valid time_slot_id straight into the CSV
+    entries = TimetableEntry.query.filter(TimetableEntry.time_slot_id.in_(slots_dict)).iter()
 
-    courses_dict = {c.id: c for c in Course.query.all()}
-    faculty_dict = {f.id: f for f in Faculty.query.all()}
-    rooms_dict = {r.id: r for r in Room.query.all()}
+    courses_dict = {c.id: c for c in Course.query.only('code', 'name').all()}
+    faculty_dict = {f.id: f for f in Faculty.query.only('name').all()}
+    rooms_dict = {r.id: r for r in Room.query.only('name').all()}
     
     output = io.StringIO()
     writer = csv.writer(output)
@@ -1,4 +1,6 @@
 import json
+from collections import Counter
+
 from app_with_navigation import app
 from scheduler import TimetableGenerator
 from models import db
@@ -9,47 +11,44 @@ def run_diagnostics():
         gen = TimetableGenerator(db)
         context = gen._load_context()
 
-        # Precompute room capabilities and time_slots
-        rooms = context.get('rooms', [])
-        room_capabilities = context.get('room_capabilities', {})
-        time_slots = context.get('time_slots', [])
+        # Expertise, room and availability checks come precomputed per course
+        eligibility = context.get('eligibility', {})
 
         results = []
         sessions = context.get('sessions', [])
+        sessions_per_course = Counter(session.course_id for session in sessions)
 
         for faculty in context.get('faculty', []):
             faculty_id = faculty.id
             name = faculty.name
             min_h = faculty.min_hours_per_week or 0
             max_h = faculty.max_hours_per_week or 0
-            avail_slots = context['faculty_availability'].get(faculty_id, set())
-            available_slot_count = len(avail_slots)
+            available_slot_count = context['faculty_slot_masks'].get(faculty_id, 0).bit_count()
 
             # Count possible sessions faculty could teach (expertise + room + availability)
             possible_session_count = 0
             missing_expertise = set()
             missing_room = set()
 
-            for session in sessions:
-                course = context['course_by_id'].get(session.course_id)
-                if not course:
+            for course_id, count in sessions_per_course.items():
+                course = context['course_by_id'].get(course_id)
+                entry = eligibility.get(course_id)
+                if not course or not entry:
                     continue
 
                 # expertise check
-                eligible_fac = gen._faculty_for_course(course, [faculty], context.get('faculty_expertise', {}))
-                if not eligible_fac:
+                if faculty_id not in entry['faculty_slot_masks']:
                     missing_expertise.add(course.code)
                     continue
 
                 # rooms check
-                eligible_rooms = gen._rooms_for_course(course, rooms, room_capabilities)
-                if not eligible_rooms:
+                if not entry['room_ids']:
                     missing_room.add(course.code)
                     continue
 
                 # availability check: at least one slot where faculty is available
-                if any(slot.id in avail_slots for slot in time_slots):
-                    possible_session_count += 1
+                if entry['faculty_slot_masks'][faculty_id]:
+                    possible_session_count += count
 
             results.append({
                 'faculty_id': faculty_id,
@@ -65,7 +64,7 @@ def run_diagnostics():
         print(json.dumps({'summary': {
             'total_sessions': len(sessions),
             'faculty_count': len(context.get('faculty', [])),
-            'time_slots': len(time_slots)
+            'time_slots': len(context.get('time_slots', []))
         }, 'per_faculty': results}, indent=2, default=str))
 
 
@@ -0,0 +1,223 @@
+"""
+Background timetable generation and repair.
+
+Jobs are GenerationJob documents in Mongo, so any app process can report on,
+cancel or accept a job. Each app process runs one worker thread that claims
+queued jobs one at a time, runs TimetableGenerator (a full `generate()`, or
+`generate_incremental()` for repair jobs), mirrors its latest progress
+event into the job, and polls the job for cancel / accept requests.
+
+Generations replace the whole timetable, so only one job runs across all
+processes: a worker claims a job only while it holds the lease document,
+which it renews with its heartbeat and releases when the job ends.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models import GenerationJob, _get_collection_name
+from scheduler import TimetableGenerator
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+GENERATE = 'generate'
+INCREMENTAL = 'incremental'
+
+# Keys of the generator's result kept on the job
+RESULT_KEYS = ('success', 'error', 'entries_created', 'entries_updated', 'entries_removed',
+               'reoptimized_sessions', 'previous_entries', 'kept_assignments', 'warnings', 'overwork_alerts')
+
+
+class GenerationQueue:
+    poll_interval = 1.0
+    # A running job whose worker has not checked in for this long is presumed dead
+    stale_after = 120
+    # Longest a progress stream holds a server worker; clients reconnect or poll
+    stream_window = 30
+    lease_collection = '__generation_lease__'
+    lease_id = 'generation'
+
+    def __init__(self, database, config=None):
+        self.db = database
+        self.config = config
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._owner = uuid.uuid4().hex
+
+    def _jobs(self):
+        return self.db._db[_get_collection_name(GenerationJob)]
+
+    def _lease(self):
+        return self.db._db[self.lease_collection]
+
+    def submit(self, requested_by=None, kind=GENERATE, params=None):
+        """Queue a job; `params` are keyword arguments of generate_incremental() for INCREMENTAL jobs"""
+        job = GenerationJob(
+            status=QUEUED,
+            kind=kind,
+            params=params or {},
+            requested_by=requested_by,
+            created_at=datetime.utcnow().isoformat(),
+            started_at=None,
+            finished_at=None,
+            progress=None,
+            result=None,
+            cancel_requested=False,
+            accept_requested=False,
+        )
+        job._save(self.db._db)
+        self.start()
+        self._wake.set()
+        return job
+
+    def get(self, job_id):
+        return GenerationJob.query.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright, or ask the worker to stop a running one"""
+        jobs = self._jobs()
+        doc = jobs.find_one_and_update(
+            {'id': job_id, 'status': QUEUED},
+            {'$set': {'status': CANCELLED, 'finished_at': datetime.utcnow().isoformat()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            doc = jobs.find_one_and_update(
+                {'id': job_id, 'status': RUNNING},
+                {'$set': {'cancel_requested': True}},
+                return_document=ReturnDocument.AFTER,
+            )
+        return GenerationJob(**doc) if doc else None
+
+    def accept(self, job_id):
+        """Ask the worker to stop a running job early and keep its best timetable"""
+        doc = self._jobs().find_one_and_update(
+            {'id': job_id, 'status': RUNNING},
+            {'$set': {'accept_requested': True}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return GenerationJob(**doc) if doc else None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='timetable-jobs', daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        # The app's session is not thread-safe; the generator writes through its own
+        database = self.db.isolated()
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[Jobs] Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                self._run(job, database)
+            finally:
+                self._release_lease()
+
+    def _claim(self):
+        jobs = self._jobs()
+        now = datetime.utcnow().isoformat()
+        jobs.update_many(
+            {'status': RUNNING, 'heartbeat': {'$lt': time.time() - self.stale_after}},
+            {'$set': {'status': FAILED, 'finished_at': now,
+                      'result': {'success': False, 'error': 'The worker running this job stopped.'}}},
+        )
+        if not self._acquire_lease():
+            return None
+        doc = jobs.find_one_and_update(
+            {'status': QUEUED},
+            {'$set': {'status': RUNNING, 'started_at': now, 'heartbeat': time.time()}},
+            sort=[('id', ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            self._release_lease()
+            return None
+        return GenerationJob(**doc)
+
+    def _acquire_lease(self):
+        """Take the lease if it is free or expired; False while another worker holds it"""
+        now = time.time()
+        try:
+            # Upserting over a live lease inserts a second document with its _id and fails
+            self._lease().find_one_and_update(
+                {'_id': self.lease_id, 'expires': {'$lt': now}},
+                {'$set': {'owner': self._owner, 'expires': now + self.stale_after}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def _renew_lease(self):
+        self._lease().update_one(
+            {'_id': self.lease_id, 'owner': self._owner},
+            {'$set': {'expires': time.time() + self.stale_after}},
+        )
+
+    def _release_lease(self):
+        self._lease().update_one({'_id': self.lease_id, 'owner': self._owner}, {'$set': {'expires': 0}})
+
+    def _run(self, job, database):
+        jobs = self._jobs()
+        latest = {}
+        generator = TimetableGenerator(database, config=self.config, progress=lambda event: latest.update(event=event))
+        generator.interruptible = True
+        done = threading.Event()
+
+        def watch():
+            while not done.wait(self.poll_interval):
+                doc = jobs.find_one_and_update(
+                    {'id': job.id},
+                    {'$set': {'heartbeat': time.time(), 'progress': latest.get('event')}},
+                    return_document=ReturnDocument.AFTER,
+                )
+                self._renew_lease()
+                if doc is None or doc.get('cancel_requested'):
+                    generator.cancel()
+                elif doc.get('accept_requested'):
+                    generator.accept_incumbent()
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        try:
+            if getattr(job, 'kind', GENERATE) == INCREMENTAL:
+                result = generator.generate_incremental(**(getattr(job, 'params', None) or {}))
+            else:
+                result = generator.generate()
+        except Exception as e:
+            result = {'success': False, 'error': f'Generation failed: {e}'}
+        finally:
+            done.set()
+            watcher.join()
+
+        if result.get('success'):
+            status = SUCCEEDED
+        elif result.get('cancelled'):
+            status = CANCELLED
+        else:
+            status = FAILED
+        jobs.update_one({'id': job.id}, {'$set': {
+            'status': status,
+            'finished_at': datetime.utcnow().isoformat(),
+            'progress': latest.get('event'),
+            'result': {key: result[key] for key in RESULT_KEYS if key in result},
+        }})
@@ -1,4 +1,7 @@
-from pymongo import MongoClient, ASCENDING
+import copy
+
+from pymongo import MongoClient, ASCENDING, DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
 from typing import Any, Dict, List
@@ -11,10 +14,15 @@ from typing import Any, Dict, List
 
 
 class _Session:
-    def __init__(self, db):
+    # Operations per bulk_write call
+    batch_size = 1000
+
+    def __init__(self, db, batch_size=None):
         self._db = db
         self._added = []
         self._deleted = []
+        if batch_size:
+            self.batch_size = batch_size
 
     def add(self, obj):
         self._added.append(obj)
@@ -23,25 +31,35 @@ class _Session:
         self._deleted.append(obj)
 
     def flush(self):
-        # First process deletions recorded by db.session.delete(obj)
-        for obj in list(self._deleted):
-            try:
-                coll = self._db[_get_collection_name(obj.__class__)]
-                obj_id = getattr(obj, 'id', None)
-                if obj_id is not None:
-                    coll.delete_one({'id': obj_id})
-                else:
-                    # If no integer id, try to remove by _id or by matching dict
-                    if hasattr(obj, '_id'):
-                        coll.delete_one({'_id': obj._id})
-                    else:
-                        coll.delete_many(obj.to_dict())
-            except Exception:
-                pass
-
-        # write added objects to DB and assign integer id if model uses 'id'
-        for obj in list(self._added):
-            obj._save(self._db)
+        # Group pending deletions and saves by collection and write each
+        # collection with ordered bulk_write calls: deletions first, then the
+        # added objects, whose missing integer ids are reserved in one step
+        ops_by_collection = {}
+        for obj in self._deleted:
+            ops = ops_by_collection.setdefault(_get_collection_name(obj.__class__), [])
+            obj_id = getattr(obj, 'id', None)
+            if obj_id is not None:
+                ops.append(DeleteOne({'id': obj_id}))
+            elif hasattr(obj, '_id'):
+                # If no integer id, try to remove by _id or by matching dict
+                ops.append(DeleteOne({'_id': obj._id}))
+            else:
+                ops.append(DeleteMany(obj.to_dict()))
+
+        added_by_collection = {}
+        for obj in self._added:
+            added_by_collection.setdefault(_get_collection_name(obj.__class__), []).append(obj)
+        for name, objs in added_by_collection.items():
+            missing = [obj for obj in objs if getattr(obj, 'id', None) is None]
+            for obj, obj_id in zip(missing, _reserve_ids(self._db, name, len(missing))):
+                obj.id = obj_id
+            ops = ops_by_collection.setdefault(name, [])
+            ops.extend(obj._write_op() for obj in objs)
+
+        for name, ops in ops_by_collection.items():
+            coll = self._db[name]
+            for start in range(0, len(ops), self.batch_size):
+                _bulk_write(coll, ops[start:start + self.batch_size])
 
     def commit(self):
         # for simplicity, flush does the persistence
@@ -49,6 +67,11 @@ class _Session:
         self._added.clear()
         self._deleted.clear()
 
+    def rollback(self):
+        # Drop pending changes; writes already flushed are not undone
+        self._added.clear()
+        self._deleted.clear()
+
 
 class _DB:
     def __init__(self):
@@ -60,6 +83,7 @@ class _DB:
     def init_app(self, app):
         uri = app.config.get('MONGO_URI', 'mongodb://localhost:27017')
         dbname = app.config.get('MONGO_DBNAME', 'timetable')
+        batch_size = app.config.get('MONGO_BULK_BATCH_SIZE')
         try:
             self.client = MongoClient(uri, serverSelectionTimeoutMS=8000)
             # Force DNS & initial server selection
@@ -69,17 +93,53 @@ class _DB:
             fallback = 'mongodb://localhost:27017'
             self.client = MongoClient(fallback)
         self._db = self.client[dbname]
-        self.session = _Session(self._db)
+        self.session = _Session(self._db, batch_size)
         self.engine = None
 
+    def isolated(self):
+        """A handle on the same database with a session of its own, for another thread"""
+        handle = copy.copy(self)
+        handle.session = _Session(self._db, self.session.batch_size if self.session else None)
+        return handle
+
     def create_all(self):
-        # No-op for MongoDB; ensure indexes where needed
-        pass
+        # Collections are created on first write; ensure the indexes models declare
+        for model_cls in _model_classes(BaseModel):
+            _ensure_indexes(self._db[_get_collection_name(model_cls)], model_cls)
 
     def drop_all(self):
         # No-op
         pass
 
+    def replace_all(self, model_cls, objects):
+        """Replace every document of `model_cls` with `objects` in one step.
+        The new documents go to a staging collection that is then renamed over
+        the live one, so readers see either the old set or the new one. If the
+        objects cannot be written (e.g. DuplicateKeyError on a unique index) the
+        staging collection is dropped, the live one is untouched and the error
+        is raised.
+        """
+        name = _get_collection_name(model_cls)
+        objects = list(objects)
+        if not objects:
+            self._db[name].delete_many({})
+            return
+        staging = self._db[f'{name}__staging']
+        staging.drop()
+        try:
+            # The rename replaces the live collection's indexes with these
+            _ensure_indexes(staging, model_cls)
+            missing = [obj for obj in objects if getattr(obj, 'id', None) is None]
+            for obj, obj_id in zip(missing, _reserve_ids(self._db, name, len(missing))):
+                obj.id = obj_id
+            batch_size = self.session.batch_size if self.session else _Session.batch_size
+            for start in range(0, len(objects), batch_size):
+                _bulk_write(staging, [InsertOne(obj.to_dict()) for obj in objects[start:start + batch_size]])
+            staging.rename(name, dropTarget=True)
+        except Exception:
+            staging.drop()
+            raise
+
 
 db = _DB()
 
@@ -89,9 +149,55 @@ def _get_collection_name(cls):
 
 
 def _get_next_id(db, name: str) -> int:
+    return _reserve_ids(db, name, 1)[0]
+
+
+def _reserve_ids(db, name: str, count: int) -> range:
+    """Reserve `count` consecutive integer ids for a collection in one round trip"""
+    if count <= 0:
+        return range(0)
     counters = db['__counters__']
-    res = counters.find_one_and_update({'_id': name}, {'$inc': {'seq': 1}}, upsert=True, return_document=True)
-    return int(res['seq'])
+    res = counters.find_one_and_update({'_id': name}, {'$inc': {'seq': count}}, upsert=True, return_document=True)
+    last = int(res['seq'])
+    return range(last - count + 1, last + 1)
+
+
+def _bulk_write(coll, ops):
+    try:
+        coll.bulk_write(ops, ordered=True)
+    except BulkWriteError as e:
+        # Callers catch DuplicateKeyError from single-document saves; keep that contract
+        for error in e.details.get('writeErrors', []):
+            if error.get('code') == 11000:
+                raise DuplicateKeyError(error.get('errmsg', 'duplicate key error'), 11000, error) from e
+        raise
+
+
+def _model_classes(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _model_classes(sub)
+
+
+def _ensure_indexes(coll, model_cls):
+    for index in (Index('id', unique=True), *model_cls.__indexes__):
+        try:
+            coll.create_index(index.keys, unique=index.unique)
+        except OperationFailure as e:
+            # e.g. existing duplicates under a unique index; keep the app starting
+            print(f"[Mongo Init] Could not create index {index.fields} on {coll.name}: {e}")
+
+
+class Index:
+    """An index a model declares in `__indexes__`; `db.create_all()` ensures it"""
+
+    def __init__(self, *fields, unique=False):
+        self.fields = fields
+        self.unique = unique
+
+    @property
+    def keys(self):
+        return [(field, ASCENDING) for field in self.fields]
 
 
 class ColumnRef:
@@ -101,6 +207,53 @@ class ColumnRef:
     def __str__(self):
         return self.name
 
+    # Comparisons build Conditions for Query.filter(), e.g.
+    # Query.filter(TimetableEntry.time_slot_id.in_(ids), TimetableEntry.room_id != 3)
+    def __eq__(self, value):
+        return Condition({self.name: value})
+
+    def __ne__(self, value):
+        return Condition({self.name: {'$ne': value}})
+
+    def __lt__(self, value):
+        return Condition({self.name: {'$lt': value}})
+
+    def __le__(self, value):
+        return Condition({self.name: {'$lte': value}})
+
+    def __gt__(self, value):
+        return Condition({self.name: {'$gt': value}})
+
+    def __ge__(self, value):
+        return Condition({self.name: {'$gte': value}})
+
+    def in_(self, values):
+        return Condition({self.name: {'$in': list(values)}})
+
+    def notin_(self, values):
+        return Condition({self.name: {'$nin': list(values)}})
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+class Condition:
+    """A Mongo query document built from ColumnRef comparisons"""
+
+    def __init__(self, document):
+        self.document = document
+
+    def __bool__(self):
+        # `Model.attr == x` is a query condition, not a comparison; as with
+        # SQLAlchemy clauses, using it as a truth value is an error
+        raise TypeError("Boolean value of a query condition is not defined; pass it to Query.filter()")
+
+    def __and__(self, other):
+        return Condition({'$and': [self.document, other.document]})
+
+    def __or__(self, other):
+        return Condition({'$or': [self.document, other.document]})
+
 
 class ModelMeta(type):
     def __getattr__(cls, item):
@@ -118,11 +271,24 @@ class Query:
         self.model_cls = model_cls
         self._filter = {}
         self._sort = None
+        self._projection = None
+        self._skip = 0
+        self._limit = 0
 
     def filter_by(self, **kwargs):
         self._filter.update(kwargs)
         return self
 
+    def filter(self, *conditions):
+        # Conditions (or raw query documents) are ANDed with the current filter
+        for condition in conditions:
+            document = condition.document if isinstance(condition, Condition) else condition
+            if self._filter.keys() & document.keys():
+                self._filter = {'$and': [self._filter, document]}
+            else:
+                self._filter.update(document)
+        return self
+
     def order_by(self, *attrs):
         # Support calling order_by(Model.field, Model.other) or order_by('field')
         sorts = []
@@ -137,28 +303,83 @@ class Query:
         self._sort = sorts if sorts else None
         return self
 
-    def all(self):
+    def only(self, *fields):
+        # Load just these fields (and `id`); other attributes stay unset, and
+        # saving such an object updates only the fields it carries
+        self._projection = dict.fromkeys(('id',) + tuple(_field_name(f) for f in fields), 1)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def offset(self, count):
+        self._skip = count
+        return self
+
+    def after_id(self, id_value):
+        # Keyset pagination: rows past `id_value` in id order. Pass the last id
+        # of the previous page (None for the first); unlike offset() every page
+        # is an index range scan, however deep
+        if id_value is not None:
+            self.filter(ColumnRef('id') > id_value)
+        self._sort = [('id', ASCENDING)]
+        return self
+
+    def _cursor(self, projection=None):
         coll = db._db[_get_collection_name(self.model_cls)]
-        cursor = coll.find(self._filter)
+        cursor = coll.find(self._filter, projection or self._projection, skip=self._skip, limit=self._limit)
         if self._sort:
             cursor = cursor.sort(self._sort)
-        return [self.model_cls(**doc) for doc in cursor]
+        return cursor
+
+    def iter(self, batch_size=1000):
+        """Yield model objects as the cursor delivers them, `batch_size` documents per round trip"""
+        for doc in self._cursor().batch_size(batch_size):
+            yield self._hydrate(doc)
+
+    def __iter__(self):
+        return self.iter()
+
+    def _hydrate(self, doc):
+        obj = self.model_cls(**doc)
+        if self._projection is not None:
+            obj._partial = True
+        return obj
+
+    def all(self):
+        return [self._hydrate(doc) for doc in self._cursor()]
 
     def first(self):
         coll = db._db[_get_collection_name(self.model_cls)]
-        doc = coll.find_one(self._filter)
+        doc = coll.find_one(self._filter, self._projection, sort=self._sort, skip=self._skip)
         if not doc:
             return None
-        return self.model_cls(**doc)
+        return self._hydrate(doc)
+
+    def values(self, *fields):
+        """Tuples of the given fields per matching document (None where missing)"""
+        names = [_field_name(f) for f in fields]
+        projection = dict.fromkeys(names, 1)
+        projection['_id'] = 0
+        return [tuple(doc.get(name) for name in names) for doc in self._cursor(projection)]
+
+    def scalars(self, field):
+        """One field of every matching document (None where missing)"""
+        return [value for (value,) in self.values(field)]
 
     def count(self):
         coll = db._db[_get_collection_name(self.model_cls)]
-        return coll.count_documents(self._filter)
+        window = {'skip': self._skip} if self._skip else {}
+        if self._limit:
+            window['limit'] = self._limit
+        return coll.count_documents(self._filter, **window)
 
     def delete(self, *args, **kwargs):
-        # Accept extra SQLAlchemy-specific args (e.g., synchronize_session)
+        # Accept extra SQLAlchemy-specific args (e.g., synchronize_session);
+        # like SQLAlchemy, return the number of deleted rows
         coll = db._db[_get_collection_name(self.model_cls)]
-        return coll.delete_many(self._filter)
+        return coll.delete_many(self._filter).deleted_count
 
     def get(self, id_value):
         coll = db._db[_get_collection_name(self.model_cls)]
@@ -174,7 +395,14 @@ class Query:
         return obj
 
 
+def _field_name(field):
+    return field if isinstance(field, str) else field.name
+
+
 class BaseModel(metaclass=ModelMeta):
+    # Indexes beyond the unique `id` one every collection gets
+    __indexes__ = ()
+
     def __init__(self, **kwargs):
         # support both Mongo _id and integer id
         # Set all provided keys as attributes
@@ -187,21 +415,31 @@ class BaseModel(metaclass=ModelMeta):
     def to_dict(self) -> Dict[str, Any]:
         d = self.__dict__.copy()
         # remove internal fields
+        d.pop('_partial', None)
         return d
 
+    def _write_op(self):
+        if getattr(self, '_partial', False):
+            # Loaded through Query.only(): never drop the fields left in the database
+            data = self.to_dict()
+            data.pop('_id', None)
+            return UpdateOne({'id': self.id}, {'$set': data})
+        return ReplaceOne({'id': self.id}, self.to_dict(), upsert=True)
+
     def _save(self, mongo_db):
         coll = mongo_db[_get_collection_name(self.__class__)]
         # ensure integer id sequence
         if getattr(self, 'id', None) is None:
             self.id = _get_next_id(mongo_db, _get_collection_name(self.__class__))
-        data = self.to_dict()
-        coll.replace_one({'id': self.id}, data, upsert=True)
+        _bulk_write(coll, [self._write_op()])
 
 
 # --- Model definitions ---
 
 
 class User(BaseModel):
+    __indexes__ = [Index('username', unique=True), Index('email', unique=True)]
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -213,26 +451,36 @@ class User(BaseModel):
 
 
 class Course(BaseModel):
+    __indexes__ = [Index('code', unique=True)]
+
     def __repr__(self):
         return f'<Course {getattr(self, "code", None)}>'
 
 
 class Faculty(BaseModel):
+    __indexes__ = [Index('username'), Index('user_id')]
+
     def __repr__(self):
         return f'<Faculty {getattr(self, "name", None)}>'
 
 
 class Room(BaseModel):
+    __indexes__ = [Index('name', unique=True)]
+
     def __repr__(self):
         return f'<Room {getattr(self, "name", None)}>'
 
 
 class Student(BaseModel):
+    __indexes__ = [Index('student_id', unique=True)]
+
     def __repr__(self):
         return f'<Student {getattr(self, "student_id", None)}>'
 
 
 class StudentGroup(BaseModel):
+    __indexes__ = [Index('name', unique=True)]
+
     def __repr__(self):
         return f'<StudentGroup {getattr(self, "name", None)}>'
 
@@ -248,11 +496,24 @@ class BreakConfig(BaseModel):
 
 
 class TimeSlot(BaseModel):
+    __indexes__ = [Index('day', 'period', unique=True)]
+
     def __repr__(self):
         return f'<TimeSlot {getattr(self, "day", None)} P{getattr(self, "period", None)}>'
 
 
+class GenerationJob(BaseModel):
+    """A queued or running timetable generation; see jobs.py"""
+
+    __indexes__ = [Index('status')]
+
+    def __repr__(self):
+        return f'<GenerationJob {getattr(self, "id", None)} {getattr(self, "status", None)}>'
+
+
 class TimetableEntry(BaseModel):
+    __indexes__ = [Index('time_slot_id', 'student_group', unique=True), Index('faculty_id'), Index('room_id')]
+
     def __repr__(self):
         return f'<TimetableEntry {getattr(self, "course_id", None)}-{getattr(self, "faculty_id", None)}-{getattr(self, "room_id", None)}-{getattr(self, "student_group", None)}>'
     pass
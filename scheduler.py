@@ -1,11 +1,25 @@
+import atexit
+import glob
 import json
 import math
+import os
+import queue
 import random
-from collections import defaultdict
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from statistics import median, pstdev
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, List, Set, Tuple
 
+import numpy as np
 import pulp
+from pymongo.errors import DuplicateKeyError
 
 from models import (
     Course,
@@ -18,6 +32,11 @@ from models import (
 )
 
 
+def _unit_sum(variables):
+    """Sum of variables with unit coefficients, built as one sparse expression"""
+    return pulp.LpAffineExpression([(var, 1) for var in variables])
+
+
 @dataclass(frozen=True)
 class Session:
     """Represents an atomic lecture hour that must be scheduled."""
@@ -30,6 +49,1012 @@ class Session:
     is_lab: bool
 
 
+def _hopcroft_karp(adjacency: List[List[int]]) -> Dict[int, int]:
+    """
+    Maximum bipartite matching (Hopcroft–Karp).
+
+    ``adjacency[i]`` lists the right-hand vertices left vertex ``i`` may take.
+    Returns a mapping of matched left indices to right vertices.
+    """
+    match_left: Dict[int, int] = {}
+    match_right: Dict[int, int] = {}
+    infinity = float("inf")
+
+    def bfs():
+        dist = {}
+        queue = []
+        for left in range(len(adjacency)):
+            if left not in match_left:
+                dist[left] = 0
+                queue.append(left)
+        found = False
+        for left in queue:
+            for right in adjacency[left]:
+                partner = match_right.get(right)
+                if partner is None:
+                    found = True
+                elif partner not in dist:
+                    dist[partner] = dist[left] + 1
+                    queue.append(partner)
+        return found, dist
+
+    def dfs(left, dist):
+        for right in adjacency[left]:
+            partner = match_right.get(right)
+            if partner is None or (dist.get(partner) == dist[left] + 1 and dfs(partner, dist)):
+                match_left[left] = right
+                match_right[right] = left
+                return True
+        dist[left] = infinity
+        return False
+
+    while True:
+        found, dist = bfs()
+        if not found:
+            break
+        for left in range(len(adjacency)):
+            if left not in match_left:
+                dfs(left, dist)
+    return match_left
+
+
+def _connected_unions(sets, limit):
+    """
+    Distinct unions of members of ``sets`` whose overlap graph is connected.
+
+    Every such union is reached by growing a member with one overlapping member
+    at a time. Returns the unions and whether the search finished within
+    ``limit`` unions.
+    """
+    unions = set(sets)
+    frontier = list(unions)
+    while frontier:
+        grown = []
+        for union in frontier:
+            for member in sets:
+                if member & union and not member <= union and union | member not in unions:
+                    if len(unions) >= limit:
+                        return unions, False
+                    unions.add(union | member)
+                    grown.append(union | member)
+        frontier = grown
+    return unions, True
+
+
+def _iter_bits(mask: int):
+    """Yield the ordinals of the set bits of ``mask`` in ascending order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _FitnessState:
+    """
+    Running penalty tallies for one timetable.
+
+    `add` and `remove` adjust `penalty` for a single assignment in O(1), so an
+    individual that differs from its parent in k genes is re-scored in O(k):
+
+    * clashes: 100 per extra booking of a (faculty, slot), (room, slot) or
+      (group, slot) pair
+    * Constraint 1: 15 per hour outside a faculty member's min/max bounds
+    * Constraint 2: 30 per student group without any lab
+    * group per-day maximum: 20 per period over the limit
+    * Constraint 5: `consecutive_weight` per back-to-back pair of the same
+      subject for a group
+    * Constraint 7: 5 per faculty hour beyond 6 in a day
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.slot_usage = defaultdict(int)
+        self.faculty_hours = defaultdict(int)
+        self.faculty_day_hours = defaultdict(int)
+        self.group_day_hours = defaultdict(int)
+        self.group_labs = defaultdict(int)
+        self.subject_slots = defaultdict(int)
+        self.subject_masks = defaultdict(int)
+        self.clashes = 0
+        self.penalty = 30 * len(tables["group_names"])
+        for faculty_id, bounds in tables["faculty_bounds"].items():
+            self.penalty += self._workload_penalty(0, bounds)
+
+    def copy(self):
+        clone = _FitnessState.__new__(_FitnessState)
+        clone.tables = self.tables
+        clone.slot_usage = self.slot_usage.copy()
+        clone.faculty_hours = self.faculty_hours.copy()
+        clone.faculty_day_hours = self.faculty_day_hours.copy()
+        clone.group_day_hours = self.group_day_hours.copy()
+        clone.group_labs = self.group_labs.copy()
+        clone.subject_slots = self.subject_slots.copy()
+        clone.subject_masks = self.subject_masks.copy()
+        clone.clashes = self.clashes
+        clone.penalty = self.penalty
+        return clone
+
+    @staticmethod
+    def _workload_penalty(hours, bounds):
+        min_hours, max_hours = bounds
+        if hours < min_hours:
+            return (min_hours - hours) * 15
+        if hours > max_hours:
+            return (hours - max_hours) * 15
+        return 0
+
+    def booking_keys(self, assignment):
+        """The (faculty, slot), (room, slot) and (group, slot) occupancy keys of an assignment"""
+        ordinal = self.tables["slot_ordinal"][assignment["slot_id"]]
+        return (
+            ("f", assignment["faculty_id"], ordinal),
+            ("r", assignment["room_id"], ordinal),
+            ("g", assignment["group"], ordinal),
+        )
+
+    def clash_count(self, assignment, replacing=None):
+        """How many of the assignment's keys are already booked, not counting `replacing`'s own bookings"""
+        released = self.booking_keys(replacing) if replacing is not None else ()
+        count = 0
+        for key in self.booking_keys(assignment):
+            usage = self.slot_usage.get(key, 0)
+            if key in released:
+                usage -= 1
+            if usage > 0:
+                count += 1
+        return count
+
+    def add(self, assignment):
+        self._apply(assignment, 1)
+
+    def remove(self, assignment):
+        self._apply(assignment, -1)
+
+    def _apply(self, assignment, sign):
+        tables = self.tables
+        ordinal = tables["slot_ordinal"][assignment["slot_id"]]
+        day = tables["slot_day"][ordinal]
+        faculty_id = assignment["faculty_id"]
+        group = assignment["group"]
+        delta = 0
+
+        # Clashes: every booking beyond the first of a resource/slot pair
+        for key in self.booking_keys(assignment):
+            before = self.slot_usage[key]
+            self.slot_usage[key] = before + sign
+            if (before if sign > 0 else before - 1) >= 1:
+                self.clashes += sign
+                delta += 100 * sign
+
+        # Constraint 1: workload bounds
+        bounds = tables["faculty_bounds"].get(faculty_id)
+        hours = self.faculty_hours[faculty_id]
+        self.faculty_hours[faculty_id] = hours + sign
+        if bounds is not None:
+            delta += self._workload_penalty(hours + sign, bounds) - self._workload_penalty(hours, bounds)
+
+        # Constraint 7: daily balance
+        key = (faculty_id, day)
+        hours = self.faculty_day_hours[key]
+        self.faculty_day_hours[key] = hours + sign
+        delta += (max(0, hours + sign - 6) - max(0, hours - 6)) * 5
+
+        # Group per-day maximum
+        key = (group, day)
+        hours = self.group_day_hours[key]
+        self.group_day_hours[key] = hours + sign
+        limit = tables["max_per_day"]
+        if limit:
+            delta += (max(0, hours + sign - limit) - max(0, hours - limit)) * 20
+
+        # Constraint 2: at least one lab per group
+        if assignment["is_lab"]:
+            labs = self.group_labs[group]
+            self.group_labs[group] = labs + sign
+            if group in tables["group_names"]:
+                if labs == 0 and sign > 0:
+                    delta -= 30
+                elif labs == 1 and sign < 0:
+                    delta += 30
+
+        # Constraint 5: consecutive lectures of the same subject. Only the two
+        # neighbours of the toggled bit can gain or lose a pair.
+        subject = (group, assignment["course_code"])
+        key = (subject, ordinal)
+        count = self.subject_slots[key]
+        self.subject_slots[key] = count + sign
+        if (sign > 0 and count == 0) or (sign < 0 and count == 1):
+            mask = self.subject_masks[subject]
+            adjacent = tables["adjacent_slot_mask"]
+            pairs = 0
+            if ordinal > 0 and (adjacent >> (ordinal - 1)) & 1 and (mask >> (ordinal - 1)) & 1:
+                pairs += 1
+            if (adjacent >> ordinal) & 1 and (mask >> (ordinal + 1)) & 1:
+                pairs += 1
+            self.subject_masks[subject] = mask ^ (1 << ordinal)
+            delta += sign * pairs * tables["consecutive_weight"]
+
+        self.penalty += delta
+
+
+class _ChromosomeSpace:
+    """
+    Candidate-index chromosomes shared by the refiners.
+
+    Position ``i`` is one session; its gene indexes into
+    ``position_candidates[i]``. Sessions of a course/group pair share their
+    candidate list, and so do the per-slot indexes built here.
+    """
+
+    def __init__(self, tables, position_candidates):
+        self.tables = tables
+        self.position_candidates = position_candidates
+
+        # Candidate indexes by slot, shared between positions with the same list
+        by_list = {}
+        self.position_slot_index = []
+        self.group_positions = defaultdict(list)
+        for position, candidates in enumerate(position_candidates):
+            key = id(candidates)
+            if key not in by_list:
+                index = defaultdict(list)
+                for gene, candidate in enumerate(candidates):
+                    index[candidate["slot_id"]].append(gene)
+                by_list[key] = dict(index)
+            self.position_slot_index.append(by_list[key])
+            if candidates:
+                self.group_positions[candidates[0]["group"]].append(position)
+        self.group_positions = dict(self.group_positions)
+
+    def score(self, genes) -> _FitnessState:
+        """Build the full fitness tallies of a gene array from scratch."""
+        state = _FitnessState(self.tables)
+        for candidates, gene in zip(self.position_candidates, genes.tolist()):
+            state.add(candidates[gene])
+        return state
+
+    def _set_gene(self, genes, position, gene, state):
+        candidates = self.position_candidates[position]
+        state.remove(candidates[genes[position]])
+        state.add(candidates[gene])
+        genes[position] = gene
+
+
+class _GeneticEngine(_ChromosomeSpace):
+    """
+    Operators of the island-model GA over candidate-index chromosomes.
+
+    Holds only picklable, immutable data (fitness tables, per-position candidate
+    lists, parameters) so it can be installed once in every island worker.
+    Individuals are (penalty, genes, tallies) tuples; islands coming back from
+    a worker carry None tallies, which the next worker rebuilds.
+
+    With `repair` enabled, mutation only moves a session to a candidate that
+    keeps faculty, room and group bookings clash-free, falling back to a slot
+    swap with another session of the same group and then to a one-level
+    ejection chain. Crossover children are repaired the same way.
+    """
+
+    repair_attempts = 16
+    max_ejections = 3
+
+    def __init__(self, tables, position_candidates, population_size, tournament_size, elitism, repair=True):
+        super().__init__(tables, position_candidates)
+        self.population_size = population_size
+        self.tournament_size = tournament_size
+        self.elitism = min(elitism, population_size - 1)
+        self.repair = repair
+
+    def mutate(self, genes, rng, state):
+        """Point mutation on a copy of the gene array, updating `state`; clash-aware with `repair`"""
+        mutated = genes.copy()
+        if not len(mutated):
+            return mutated
+        position = rng.randrange(len(mutated))
+        candidates = self.position_candidates[position]
+        if not candidates:
+            return mutated
+        if self.repair:
+            self._relocate(mutated, position, rng, state) or self._swap(mutated, position, rng, state) \
+                or self._eject(mutated, position, rng, state)
+            return mutated
+        self._set_gene(mutated, position, rng.randrange(len(candidates)), state)
+        return mutated
+
+    def repair_clashes(self, genes, rng, state):
+        """Move every clashing session of `genes` (in place) to a clash-free placement where one exists"""
+        if not self.repair or not state.clashes:
+            return
+        clashing = []
+        for position, gene in enumerate(genes.tolist()):
+            candidates = self.position_candidates[position]
+            if candidates and state.clash_count(candidates[gene], candidates[gene]):
+                clashing.append(position)
+        rng.shuffle(clashing)
+        for position in clashing:
+            current = self.position_candidates[position][genes[position]]
+            if state.clash_count(current, current):
+                self._relocate(genes, position, rng, state) or self._swap(genes, position, rng, state) \
+                    or self._eject(genes, position, rng, state)
+
+    def _relocate(self, genes, position, rng, state):
+        """Move a session to a random clash-free candidate; sampled first, then by full scan"""
+        candidates = self.position_candidates[position]
+        current_gene = int(genes[position])
+        current = candidates[current_gene]
+        for _ in range(self.repair_attempts):
+            gene = rng.randrange(len(candidates))
+            if gene != current_gene and not state.clash_count(candidates[gene], current):
+                self._set_gene(genes, position, gene, state)
+                return True
+        free = [
+            gene for gene, candidate in enumerate(candidates)
+            if gene != current_gene and not state.clash_count(candidate, current)
+        ]
+        if free:
+            self._set_gene(genes, position, rng.choice(free), state)
+            return True
+        return False
+
+    def _free_gene_at(self, position, slot_id, rng, state):
+        candidates = self.position_candidates[position]
+        options = [
+            gene for gene in self.position_slot_index[position].get(slot_id, ())
+            if not state.clash_count(candidates[gene])
+        ]
+        return rng.choice(options) if options else None
+
+    def _swap(self, genes, position, rng, state):
+        """Exchange slots with another session of the same group"""
+        candidates = self.position_candidates[position]
+        peers = self.group_positions.get(candidates[0]["group"], [])
+        if len(peers) < 2:
+            return False
+        for _ in range(self.repair_attempts):
+            other = rng.choice(peers)
+            other_candidates = self.position_candidates[other]
+            mine, theirs = candidates[genes[position]], other_candidates[genes[other]]
+            if other == position or mine["slot_id"] == theirs["slot_id"]:
+                continue
+            state.remove(mine)
+            state.remove(theirs)
+            new_mine = self._free_gene_at(position, theirs["slot_id"], rng, state)
+            if new_mine is not None:
+                state.add(candidates[new_mine])
+                new_theirs = self._free_gene_at(other, mine["slot_id"], rng, state)
+                if new_theirs is not None:
+                    state.add(other_candidates[new_theirs])
+                    genes[position] = new_mine
+                    genes[other] = new_theirs
+                    return True
+                state.remove(candidates[new_mine])
+            state.add(mine)
+            state.add(theirs)
+        return False
+
+    def _eject(self, genes, position, rng, state):
+        """Ejection chain: take a random candidate and relocate the few sessions it displaces"""
+        candidates = self.position_candidates[position]
+        gene = rng.randrange(len(candidates))
+        wanted = set(state.booking_keys(candidates[gene]))
+        victims = []
+        for other, other_gene in enumerate(genes.tolist()):
+            if other == position:
+                continue
+            if wanted.intersection(state.booking_keys(self.position_candidates[other][other_gene])):
+                victims.append(other)
+                if len(victims) > self.max_ejections:
+                    return False
+
+        original = {other: int(genes[other]) for other in victims + [position]}
+        self._set_gene(genes, position, gene, state)
+        changed = [position]
+        for other in victims:
+            if not self._relocate(genes, other, rng, state):
+                for undo in reversed(changed):
+                    self._set_gene(genes, undo, original[undo], state)
+                return False
+            changed.append(other)
+        return True
+
+    def crossover(self, genes_a, genes_b, gene_rng, state):
+        """Uniform crossover as a mask select; `state` holds genes_a's tallies and is updated for genes taken from genes_b"""
+        take_b = gene_rng.random(len(genes_a)) < 0.5
+        child = np.where(take_b, genes_b, genes_a)
+        for position in np.flatnonzero(take_b & (genes_a != genes_b)).tolist():
+            candidates = self.position_candidates[position]
+            state.remove(candidates[genes_a[position]])
+            state.add(candidates[genes_b[position]])
+        return child
+
+    def select(self, population, rng):
+        """Tournament selection"""
+        contestants = rng.sample(population, k=min(self.tournament_size, len(population)))
+        return min(contestants, key=lambda individual: individual[0])
+
+    def rate(self, bred):
+        """Attach penalties to bred (genes, tallies) pairs"""
+        return [(state.penalty, genes, state) for genes, state in bred]
+
+    def evolve(self, population, generations, seed, deadline=None):
+        """Run up to `generations` generations; returns the population and the number run"""
+        rng = random.Random(seed)
+        gene_rng = np.random.default_rng(seed)
+        ran = 0
+        for _ in range(generations):
+            if deadline is not None and time.time() >= deadline:
+                break
+            population.sort(key=lambda individual: individual[0])
+            survivors = population[:self.elitism]
+            bred = []
+            while len(survivors) + len(bred) < self.population_size:
+                parent_a = self.select(population, rng)
+                parent_b = self.select(population, rng)
+                state = parent_a[2].copy()
+                child = self.crossover(parent_a[1], parent_b[1], gene_rng, state)
+                self.repair_clashes(child, rng, state)
+                bred.append((self.mutate(child, rng, state), state))
+            population = survivors + self.rate(bred)
+            ran += 1
+        return population, ran
+
+
+class _LocalSearch(_ChromosomeSpace):
+    """
+    Single-solution refiners: tabu search and simulated annealing.
+
+    Moves are a random relocation, a slot swap between two sessions of the same
+    group, and a Kempe-chain interchange. The chain takes the sessions reachable
+    from one session through shared faculty, rooms or groups across two slots
+    and swaps their slots, keeping each session's faculty and room. Every move
+    is delta-scored on the running tallies and undone when rejected. Moves that
+    add faculty, room or group clashes are never taken, whatever they save in
+    soft penalties, so the result has at most as many clashes as the start.
+    """
+
+    max_chain = 12
+
+    def __init__(self, tables, position_candidates, genes, seed):
+        super().__init__(tables, position_candidates)
+        self.rng = random.Random(seed)
+        self.genes = genes.copy()
+        self.state = self.score(self.genes)
+        self.at_slot = defaultdict(set)
+        for position, gene in enumerate(self.genes.tolist()):
+            if position_candidates[position]:
+                self.at_slot[position_candidates[position][gene]["slot_id"]].add(position)
+        self.best_genes = self.genes.copy()
+        self.best_penalty = self.state.penalty
+        self.best_clashes = self.state.clashes
+        self.iterations = 0
+        self.stop = None  # optional threading.Event checked with the deadline
+
+    def _candidate(self, position, gene=None):
+        candidates = self.position_candidates[position]
+        return candidates[self.genes[position] if gene is None else gene]
+
+    def _apply(self, changes):
+        """Set (position, gene) pairs; returns the undo list"""
+        undo = []
+        for position, gene in changes:
+            old = int(self.genes[position])
+            if old == gene:
+                continue
+            self.at_slot[self._candidate(position, old)["slot_id"]].discard(position)
+            self.at_slot[self._candidate(position, gene)["slot_id"]].add(position)
+            self._set_gene(self.genes, position, gene, self.state)
+            undo.append((position, old))
+        return undo
+
+    def _undo(self, undo):
+        self._apply(list(reversed(undo)))
+
+    def _record_best(self):
+        if (self.state.clashes, self.state.penalty) < (self.best_clashes, self.best_penalty):
+            self.best_clashes = self.state.clashes
+            self.best_penalty = self.state.penalty
+            self.best_genes = self.genes.copy()
+
+    def _gene_like(self, position, slot_id, template, strict=False):
+        """A candidate of `position` in `slot_id`, preferring the template's faculty and room"""
+        options = self.position_slot_index[position].get(slot_id)
+        if not options:
+            return None
+        candidates = self.position_candidates[position]
+        same_faculty = [g for g in options if candidates[g]["faculty_id"] == template["faculty_id"]]
+        exact = [g for g in same_faculty if candidates[g]["room_id"] == template["room_id"]]
+        if exact:
+            return exact[0]
+        if strict:
+            return None
+        return self.rng.choice(same_faculty or options)
+
+    def propose(self):
+        """A random relocation, same-group swap or Kempe-chain move as (position, gene) changes"""
+        if not len(self.genes):
+            return None
+        position = self.rng.randrange(len(self.genes))
+        candidates = self.position_candidates[position]
+        if not candidates:
+            return None
+        roll = self.rng.random()
+        if roll < 0.5:
+            return [(position, self.rng.randrange(len(candidates)))]
+        if roll < 0.75:
+            return self._swap_move(position)
+        return self._kempe_move(position)
+
+    def _swap_move(self, position):
+        peers = self.group_positions.get(self.position_candidates[position][0]["group"], [])
+        other = self.rng.choice(peers)
+        mine, theirs = self._candidate(position), self._candidate(other)
+        if other == position or mine["slot_id"] == theirs["slot_id"]:
+            return None
+        new_mine = self._gene_like(position, theirs["slot_id"], mine)
+        new_theirs = self._gene_like(other, mine["slot_id"], theirs)
+        if new_mine is None or new_theirs is None:
+            return None
+        return [(position, new_mine), (other, new_theirs)]
+
+    def _kempe_move(self, position):
+        first_slot = self._candidate(position)["slot_id"]
+        slots = [slot_id for slot_id in self.position_slot_index[position] if slot_id != first_slot]
+        if not slots:
+            return None
+        second_slot = self.rng.choice(slots)
+
+        def resources(candidate):
+            return {("f", candidate["faculty_id"]), ("r", candidate["room_id"]), ("g", candidate["group"])}
+
+        chain = {position}
+        frontier = [position]
+        while frontier:
+            current = frontier.pop()
+            current_slot = self._candidate(current)["slot_id"]
+            other_slot = second_slot if current_slot == first_slot else first_slot
+            used = resources(self._candidate(current))
+            for other in self.at_slot.get(other_slot, ()):
+                if other not in chain and used & resources(self._candidate(other)):
+                    chain.add(other)
+                    frontier.append(other)
+                    if len(chain) > self.max_chain:
+                        return None
+
+        changes = []
+        for member in chain:
+            current = self._candidate(member)
+            target = second_slot if current["slot_id"] == first_slot else first_slot
+            gene = self._gene_like(member, target, current, strict=True)
+            if gene is None:
+                return None
+            changes.append((member, gene))
+        return changes
+
+    def _evaluate(self, changes):
+        """Delta-score a move without keeping it; returns (penalty, clashes, changed)"""
+        undo = self._apply(changes)
+        penalty, clashes = self.state.penalty, self.state.clashes
+        self._undo(undo)
+        return penalty, clashes, bool(undo)
+
+    def tabu_search(self, iterations, deadline, tenure, sample_size):
+        """Best non-tabu move of a sampled neighbourhood per iteration; a move is tabu when it
+        returns a session to a slot it recently left, unless it beats the best found."""
+        tabu_until = {}
+        for iteration in range(iterations):
+            if deadline is not None and time.time() >= deadline:
+                break
+            if self.stop is not None and self.stop.is_set():
+                break
+            self.iterations = iteration + 1
+            best_move = None
+            for _ in range(sample_size):
+                changes = self.propose()
+                if not changes:
+                    continue
+                penalty, clashes, changed = self._evaluate(changes)
+                if not changed or clashes > self.state.clashes:
+                    continue
+                is_tabu = any(
+                    tabu_until.get((p, self._candidate(p, g)["slot_id"]), -1) > iteration for p, g in changes
+                )
+                if is_tabu and penalty >= self.best_penalty:
+                    continue
+                if best_move is None or penalty < best_move[0]:
+                    best_move = (penalty, changes)
+            if best_move is None:
+                continue
+            for position, old in self._apply(best_move[1]):
+                tabu_until[(position, self._candidate(position, old)["slot_id"])] = iteration + tenure
+            self._record_best()
+
+    def anneal(self, iterations, deadline, start_temperature, end_temperature):
+        """Simulated annealing with geometric cooling over iterations or the time budget"""
+        started = time.time()
+        for iteration in range(iterations):
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                break
+            if self.stop is not None and self.stop.is_set():
+                break
+            self.iterations = iteration + 1
+            progress = iteration / iterations
+            if deadline is not None:
+                progress = max(progress, (now - started) / max(deadline - started, 1e-9))
+            temperature = start_temperature * (end_temperature / start_temperature) ** progress
+            changes = self.propose()
+            if not changes:
+                continue
+            before, clashes = self.state.penalty, self.state.clashes
+            undo = self._apply(changes)
+            delta = self.state.penalty - before
+            if self.state.clashes > clashes:
+                self._undo(undo)
+            elif delta <= 0 or self.rng.random() < math.exp(-delta / temperature):
+                self._record_best()
+            else:
+                self._undo(undo)
+
+
+# GA engine installed once per island worker by `_init_ga_worker`
+_GA_WORKER_ENGINE = None
+
+
+def _init_ga_worker(engine):
+    global _GA_WORKER_ENGINE
+    _GA_WORKER_ENGINE = engine
+
+
+def _evolve_island(population, generations, seed, deadline):
+    """Evolve one island in a worker; tallies are rebuilt locally and not sent back"""
+    engine = _GA_WORKER_ENGINE
+    population = [(penalty, genes, engine.score(genes)) for penalty, genes, _ in population]
+    population, ran = engine.evolve(population, generations, seed, deadline)
+    return [(penalty, genes, None) for penalty, genes, _ in population], ran
+
+
+class _SolveMonitor:
+    """
+    Progress of one running solve.
+
+    Backends call `report` with the incumbent objective and best bound as they
+    improve, which emits an "ilp" progress event with the relative gap, and poll
+    `accepted` to stop early and keep the incumbent. A backend that cannot
+    follow the solve live or stop it on this platform says so with `notice`.
+    """
+
+    def __init__(self, emit, accepted):
+        self.emit = emit
+        self.accepted = accepted
+        self.incumbent = None
+        self.bound = None
+        self.notices = []
+
+    def notice(self, text):
+        if text not in self.notices:
+            self.notices.append(text)
+
+    def report(self, incumbent=None, bound=None):
+        changed = False
+        if incumbent is not None and incumbent != self.incumbent:
+            self.incumbent = incumbent
+            changed = True
+        if bound is not None and bound != self.bound:
+            self.bound = bound
+            changed = True
+        if changed:
+            self.emit("ilp", incumbent=self.incumbent, bound=self.bound, gap=self.gap)
+
+    @property
+    def gap(self):
+        if self.incumbent is None or self.bound is None:
+            return None
+        return abs(self.incumbent - self.bound) / max(1e-9, abs(self.incumbent))
+
+
+class _CbcBackend:
+    """
+    COIN-OR CBC through PuLP (bundled with PuLP).
+
+    With a monitor, CBC logs to a temporary file that a watcher thread parses for
+    incumbents and bounds, and accepting the incumbent stops the solve early.
+    Both depend on the platform, as reported by `live_support()`:
+
+    - progress: CBC block-buffers its output to a file, so it is run through a
+      wrapper script calling `stdbuf -oL`, which flushes every line. Without
+      stdbuf (e.g. macOS, Windows) CBC runs directly and its events arrive when
+      the solve ends.
+    - accept: the running CBC process is found through /proc and sent SIGINT,
+      on which it stops and still writes its best solution. CBC acts on it
+      between branch-and-bound nodes, so a root node (preprocessing, cuts,
+      root heuristics) in progress still completes first. Without /proc
+      (anything but Linux) the solve runs to its optimum or time limit, and
+      the accept takes effect after it.
+
+    Each fallback adds a notice to the result's warnings.
+    """
+
+    name = "cbc"
+    poll_interval = 0.25
+    # CBC logs its banner at once; a longer solve with nothing logged until it ended was buffered
+    live_check_after = 2.0
+    no_progress_notice = (
+        "⚠️ CBC reported no progress until its solve ended – following it live needs stdbuf."
+    )
+    no_accept_notice = (
+        "⚠️ Early accept cannot stop a running CBC solve on this platform (it needs Linux /proc) – "
+        "it took effect after the solve."
+    )
+    _number = r"(-?\d+(?:\.\d+)?(?:e[+-]?\d+)?)"
+    _incumbent_re = re.compile(r"Integer solution of " + _number)
+    _progress_re = re.compile(_number + r" best solution, best possible " + _number)
+    _partial_re = re.compile(r"best objective " + _number + r" \(best possible " + _number + r"\)")
+    _relaxation_re = re.compile(r"Continuous objective value is " + _number)
+
+    _line_buffered = None  # path of the stdbuf wrapper, "" without stdbuf
+
+    def available(self):
+        return pulp.PULP_CBC_CMD(msg=0).available()
+
+    @staticmethod
+    def live_support():
+        """Whether a monitored solve can report "progress" live (stdbuf) and "accept" early (/proc, SIGINT)"""
+        return {
+            "progress": os.name == "posix" and shutil.which("stdbuf") is not None,
+            "accept": hasattr(signal, "SIGINT") and bool(glob.glob(f"/proc/{os.getpid()}/task/*/children")),
+        }
+
+    @classmethod
+    def _line_buffered_path(cls):
+        """An executable that runs PuLP's CBC with line-buffered stdout, or "" without stdbuf"""
+        if cls._line_buffered is None:
+            stdbuf = shutil.which("stdbuf") if os.name == "posix" else None
+            cls._line_buffered = ""
+            if stdbuf:
+                handle, path = tempfile.mkstemp(suffix=".sh", prefix="cbc_")
+                with os.fdopen(handle, "w") as script:
+                    # exec keeps the PID, so _interrupt still finds CBC by its stdout
+                    script.write(f'#!/bin/sh\nexec "{stdbuf}" -oL "{pulp.PULP_CBC_CMD().path}" "$@"\n')
+                os.chmod(path, 0o755)
+                atexit.register(os.remove, path)
+                cls._line_buffered = path
+        return cls._line_buffered
+
+    def solve(self, problem, time_limit, threads, warm_start, gap=None, monitor=None):
+        if monitor is None:
+            return problem.solve(pulp.PULP_CBC_CMD(
+                msg=0, timeLimit=time_limit, threads=threads, warmStart=warm_start, gapRel=gap,
+            ))
+
+        support = self.live_support()
+        handle, log_path = tempfile.mkstemp(suffix=".log", prefix="cbc_")
+        os.close(handle)
+        done = threading.Event()
+        watcher = threading.Thread(
+            target=self._watch, args=(log_path, monitor, done, support["accept"]), daemon=True,
+        )
+        watcher.start()
+        options = dict(msg=0, timeLimit=time_limit, threads=threads, warmStart=warm_start, gapRel=gap, logPath=log_path)
+        wrapper = self._line_buffered_path() if support["progress"] else ""
+        command = pulp.COIN_CMD(path=wrapper, **options) if wrapper else pulp.PULP_CBC_CMD(**options)
+        try:
+            return problem.solve(command)
+        finally:
+            done.set()
+            watcher.join()
+            os.remove(log_path)
+
+    def _watch(self, log_path, monitor, done, can_interrupt=True):
+        stopping = False
+        live = False
+        started = time.monotonic()
+        with open(log_path) as log:
+            while True:
+                finished = done.is_set()
+                lines = log.readlines()
+                live = live or (bool(lines) and not finished)
+                for line in lines:
+                    self._parse(line, monitor)
+                if finished:
+                    if not live and time.monotonic() - started > self.live_check_after:
+                        monitor.notice(self.no_progress_notice)
+                    return
+                if monitor.accepted.is_set() and not stopping:
+                    if can_interrupt:
+                        stopping = self._interrupt(log_path)
+                    else:
+                        monitor.notice(self.no_accept_notice)
+                        stopping = True
+                done.wait(self.poll_interval)
+
+    def _parse(self, line, monitor):
+        match = self._progress_re.search(line) or self._partial_re.search(line)
+        if match:
+            monitor.report(incumbent=float(match.group(1)), bound=float(match.group(2)))
+            return
+        match = self._incumbent_re.search(line)
+        if match:
+            monitor.report(incumbent=float(match.group(1)))
+            return
+        match = self._relaxation_re.search(line)
+        if match:
+            monitor.report(bound=float(match.group(1)))
+
+    def _interrupt(self, log_path):
+        """SIGINT the CBC child whose stdout is `log_path`"""
+        for children in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+            try:
+                with open(children) as handle:
+                    pids = handle.read().split()
+            except OSError:
+                continue
+            for pid in pids:
+                try:
+                    if os.readlink(f"/proc/{pid}/fd/1") == log_path:
+                        os.kill(int(pid), signal.SIGINT)
+                        return True
+                except OSError:
+                    continue
+        return False
+
+
+class _HighsBackend:
+    """HiGHS through PuLP's highspy interface; PuLP passes it no MIP start or progress"""
+
+    name = "highs"
+
+    def available(self):
+        return pulp.HiGHS(msg=0).available()
+
+    def solve(self, problem, time_limit, threads, warm_start, gap=None, monitor=None):
+        return problem.solve(pulp.HiGHS(msg=0, timeLimit=time_limit, threads=threads, gapRel=gap))
+
+
+class _CpSatBackend:
+    """
+    OR-tools CP-SAT on the PuLP model.
+
+    Clash rows (unit coefficients over Booleans, at most or exactly one) become
+    native AtMostOne/ExactlyOne constraints; other rows stay linear. Continuous
+    variables of the models (slacks, soft-penalty and linking variables) take
+    integral values at every integral assignment, so they become integers.
+    Fractional coefficients are scaled to integers. The solution is written
+    back into the PuLP variables, so callers read it with `pulp.value`.
+    """
+
+    name = "cpsat"
+    domain_bound = 10**6  # for variables PuLP leaves unbounded
+    max_decimals = 6
+
+    def available(self):
+        try:
+            from ortools.sat.python import cp_model  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _scale(self, coefficients):
+        for decimals in range(self.max_decimals + 1):
+            factor = 10 ** decimals
+            if all(abs(c * factor - round(c * factor)) < 1e-9 for c in coefficients):
+                return factor
+        return 10 ** self.max_decimals
+
+    def solve(self, problem, time_limit, threads, warm_start, gap=None, monitor=None):
+        from ortools.sat.python import cp_model
+
+        model = cp_model.CpModel()
+        variables = problem.variables()
+        cp_vars = {}
+        booleans = set()
+        for var in variables:
+            low = math.ceil(var.lowBound) if var.lowBound is not None else -self.domain_bound
+            high = math.floor(var.upBound) if var.upBound is not None else self.domain_bound
+            if (low, high) == (0, 1):
+                cp_vars[var.name] = model.new_bool_var(var.name)
+                booleans.add(var.name)
+            else:
+                cp_vars[var.name] = model.new_int_var(low, high, var.name)
+            if warm_start and var.varValue is not None:
+                model.add_hint(cp_vars[var.name], round(var.varValue))
+
+        for constraint in problem.constraints.values():
+            terms = list(constraint.items())
+            if not terms:
+                continue
+            rhs = -constraint.constant
+            if rhs == 1 and all(c == 1 and var.name in booleans for var, c in terms):
+                literals = [cp_vars[var.name] for var, _ in terms]
+                if constraint.sense == pulp.LpConstraintLE:
+                    model.add_at_most_one(literals)
+                    continue
+                if constraint.sense == pulp.LpConstraintEQ:
+                    model.add_exactly_one(literals)
+                    continue
+            factor = self._scale([c for _, c in terms])
+            expression = sum(round(c * factor) * cp_vars[var.name] for var, c in terms)
+            bound = rhs * factor
+            if constraint.sense == pulp.LpConstraintLE:
+                model.add(expression <= math.floor(bound + 1e-9))
+            elif constraint.sense == pulp.LpConstraintGE:
+                model.add(expression >= math.ceil(bound - 1e-9))
+            else:
+                model.add(expression == round(bound))
+
+        objective = list(problem.objective.items()) if problem.objective is not None else []
+        factor = 1
+        if objective:
+            factor = self._scale([c for _, c in objective])
+            expression = sum(round(c * factor) * cp_vars[var.name] for var, c in objective)
+            if problem.sense == pulp.LpMaximize:
+                model.maximize(expression)
+            else:
+                model.minimize(expression)
+
+        solver = cp_model.CpSolver()
+        if time_limit:
+            solver.parameters.max_time_in_seconds = time_limit
+        if threads:
+            solver.parameters.num_workers = threads
+        if gap is not None:
+            solver.parameters.relative_gap_limit = gap
+
+        callback = None
+        done = threading.Event()
+        if monitor is not None:
+            class _Progress(cp_model.CpSolverSolutionCallback):
+                def on_solution_callback(self):
+                    monitor.report(incumbent=self.objective_value / factor, bound=self.best_objective_bound / factor)
+
+            def watch():
+                # Accepting can happen between solutions, so poll instead of
+                # relying on the solution callback alone
+                while not done.wait(0.25):
+                    if monitor.accepted.is_set():
+                        solver.stop_search()
+                        return
+
+            callback = _Progress()
+            threading.Thread(target=watch, daemon=True).start()
+        try:
+            status = solver.solve(model, callback)
+        finally:
+            done.set()
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            # Like CBC stopped by its time limit, a feasible incumbent counts as solved
+            for var in variables:
+                var.varValue = solver.value(cp_vars[var.name])
+            problem.status = pulp.LpStatusOptimal
+        elif status == cp_model.INFEASIBLE:
+            problem.status = pulp.LpStatusInfeasible
+        elif status == cp_model.MODEL_INVALID:
+            problem.status = pulp.LpStatusUndefined
+        else:
+            problem.status = pulp.LpStatusNotSolved
+        return problem.status
+
+
+SOLVER_BACKENDS = {backend.name: backend for backend in (_CbcBackend(), _HighsBackend(), _CpSatBackend())}
+
+
+def _solve_ilp_component(config, context):
+    """Solve one conflict-graph component in a worker; candidates come back stripped"""
+    generator = TimetableGenerator(None, config=config)
+    result = generator._solve_with_ilp(context)
+    if result["success"]:
+        result["session_candidates"] = generator._index_assignment_candidates(result["session_candidates"])
+    return result
+
+
+def _generate_seed(config, seed, context, ilp_result):
+    """One generate_many run in a worker: refine (and solve, without a shared ILP) under `seed`"""
+    generator = TimetableGenerator(None, random_seed=seed, config=config)
+    outcome = generator._generate_assignments(context, ilp_result)
+    if outcome["success"]:
+        outcome["fitness"] = generator._fitness(outcome["assignments"], context)
+    return outcome
+
+
 class TimetableGenerator:
     """
     Enhanced Hybrid scheduler with 9 advanced constraints:
@@ -45,8 +1070,26 @@ class TimetableGenerator:
     9. Overwork detection & alerts (40+ hours/week warning)
     """
 
-    def __init__(self, db_session, random_seed: int | None = None, config: dict = None):
+    # Default per-engine time limits in seconds
+    SOLVER_TIME_LIMITS = {"cbc": 60, "highs": 60, "cpsat": 60}
+    # Engines that do not scale to the expanded ILP (one binary per faculty ×
+    # room × slot per session): PuLP's transfer of it to highspy alone outlasts
+    # the time limit, and CP-SAT finds no solution within it. They need
+    # ilp_mode 'aggregated', where both beat CBC's expanded solve
+    AGGREGATED_ONLY_SOLVERS = {"highs", "cpsat"}
+    # ILP formulations selectable with config['ilp_mode']
+    ILP_MODES = ("expanded", "aggregated")
+    # Most room-set unions that get a per-slot capacity row under room matching
+    ROOM_UNION_LIMIT = 2000
+
+    def __init__(self, db_session, random_seed: int | None = None, config: dict = None, progress=None):
         self.db = db_session
+        # Progress events: progress({"phase": ..., "elapsed": ..., ...}) is called
+        # from the generating thread; see `generate_events` for an iterator
+        self.progress = progress
+        self._accepted = threading.Event()
+        self._cancelled = threading.Event()
+        self._started = time.time()
         self.random = random.Random(random_seed or random.randint(1, 999_999))
         
         # Enhanced configuration options
@@ -55,22 +1098,120 @@ class TimetableGenerator:
         self.senior_faculty_preference = self.config.get('senior_faculty_preference', True)
         self.consecutive_penalty_weight = self.config.get('consecutive_penalty', 20)
         self.lab_priority_weight = self.config.get('lab_priority', 50)
+        # ILP objective: 'priority' (hard constraints and priority scores only),
+        # 'weighted' (adds the soft consecutive/daily-load penalties of `_fitness`)
+        # or 'lexicographic' (minimum hours first, then soft quality)
+        self.ilp_objective = self.config.get('ilp_objective', 'priority')
+        # Pass the stored timetable to CBC as a MIP start; `stability_reward`
+        # additionally rewards every assignment that repeats a stored entry
+        self.warm_start = self.config.get('warm_start', True)
+        self.stability_reward = self.config.get('stability_reward', 10)
+        # MILP engine: 'cbc', 'highs' or 'cpsat' (see SOLVER_BACKENDS). The time
+        # limit (seconds) is a number or a dict per engine; threads=None keeps
+        # the engine default
+        self.solver_name = self.config.get('solver', 'cbc')
+        self.solver_threads = self.config.get('solver_threads')
+        self.solver_time_limit = self.config.get('solver_time_limit', self.SOLVER_TIME_LIMITS)
+        # Notices about the run (e.g. solver capabilities) reported with the result
+        self.notices = []
+        # Stop a solve as soon as its relative gap is at most `accept_gap`;
+        # `accept_incumbent()` stops it on demand when `interruptible`
+        self.accept_gap = self.config.get('accept_gap')
+        self.interruptible = self.config.get('interruptible', False)
+        # Solve independent components of the conflict graph separately,
+        # across `ilp_workers` processes when more than one
+        self.ilp_components = self.config.get('ilp_components', True)
+        self.ilp_workers = int(self.config.get('ilp_workers', 1))
+        # generate_incremental: rings of neighbouring sessions released with the changed ones
+        self.incremental_ring = int(self.config.get('incremental_ring', 1))
+
+        # Genetic refiner: island model with tournament selection and elitism.
+        # Runs `ga_generations` at most, stopping early on `ga_time_limit`
+        # (seconds) or after `ga_patience` generations without improvement.
+        self.ga_population_size = max(2, int(self.config.get('ga_population_size', 10)))
+        self.ga_generations = int(self.config.get('ga_generations', 15))
+        self.ga_islands = max(1, int(self.config.get('ga_islands', 1)))
+        self.ga_migration_interval = max(1, int(self.config.get('ga_migration_interval', 5)))
+        self.ga_migration_size = max(0, int(self.config.get('ga_migration_size', 1)))
+        self.ga_tournament_size = max(1, int(self.config.get('ga_tournament_size', 3)))
+        self.ga_elitism = max(0, int(self.config.get('ga_elitism', 2)))
+        self.ga_time_limit = self.config.get('ga_time_limit')
+        self.ga_patience = self.config.get('ga_patience')
+        self.ga_island_processes = bool(self.config.get('ga_island_processes', False))
+        self.ga_repair = bool(self.config.get('ga_repair', True))
+
+        # Local-search refiners (config['refiner'] = 'tabu' or 'annealing')
+        self.refiner_time_limit = self.config.get('refiner_time_limit', 10)  # seconds
+        self.refiner_iterations = int(self.config.get('refiner_iterations', 20_000))
+        self.tabu_tenure = int(self.config.get('tabu_tenure', 20))
+        self.tabu_sample_size = int(self.config.get('tabu_sample_size', 30))
+        self.annealing_start_temperature = float(self.config.get('annealing_start_temperature', 200))
+        self.annealing_end_temperature = float(self.config.get('annealing_end_temperature', 1))
 
     # --------------------------------------------------------------------- #
     # Public API
     # --------------------------------------------------------------------- #
+    def accept_incumbent(self):
+        """Stop the running solve and refinement early and keep the best solution so far"""
+        self._accepted.set()
+
+    def cancel(self):
+        """Stop the running generation and leave the stored timetable untouched"""
+        self._cancelled.set()
+        self._accepted.set()
+
+    def _emit(self, phase, **data):
+        if self.progress is not None:
+            self.progress({"phase": phase, "elapsed": round(time.time() - self._started, 2), **data})
+
+    def generate_events(self):
+        """
+        Run `generate()` in a thread and yield its progress events.
+
+        The last event is {"phase": "done", "result": <generate() result>}.
+        `accept_incumbent()` may be called from another thread meanwhile.
+        """
+        events = queue.Queue()
+        forward = self.progress
+        outcome = {}
+
+        def emit(event):
+            events.put(event)
+            if forward is not None:
+                forward(event)
+
+        def run():
+            try:
+                outcome["result"] = self.generate()
+            except Exception as exc:
+                outcome["result"] = {"success": False, "error": str(exc)}
+            finally:
+                events.put(None)
+
+        self.progress = emit
+        self.interruptible = True
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            self.progress = forward
+        yield {"phase": "done", "elapsed": round(time.time() - self._started, 2), "result": outcome["result"]}
+
     def generate(self):
+        self._started = time.time()
+        self._emit("load")
         context = self._load_context()
-        if not context["courses"]:
-            return {"success": False, "error": "No courses found. Please add courses first."}
-        if not context["faculty"]:
-            return {"success": False, "error": "No faculty found. Please add faculty first."}
-        if not context["rooms"]:
-            return {"success": False, "error": "No rooms found. Please add rooms first."}
-        if not context["time_slots"]:
-            return {"success": False, "error": "No time slots found. Please configure time slots."}
+        error = self._context_error(context)
+        if error:
+            return {"success": False, "error": error}
 
         # Constraint 1: Validate workload bounds
+        self._emit("bound_analysis", sessions=len(context["sessions"]))
         bound_report = self._run_bound_analyzer(context)
         if not bound_report["feasible"]:
             return {
@@ -79,14 +1220,114 @@ class TimetableGenerator:
                 "warnings": bound_report["warnings"],
             }
 
-        # Constraint 2 & 3: ILP with lab priority and availability focus
-        ilp_result = self._solve_with_ilp(context)
-        warnings = bound_report["warnings"] + ilp_result.get("warnings", [])
+        outcome = self._generate_assignments(context)
+        outcome["warnings"] = self.notices + bound_report["warnings"] + outcome["warnings"]
+        if not outcome["success"]:
+            return outcome
+        return self._finish(outcome, context)
+
+    def generate_many(self, n, workers=1, variants=None):
+        """
+        Best-of-N generation: run `n` seeds and keep the timetable with the
+        lowest final fitness.
+
+        Every run refines under its own seed. `variants` is an optional list of
+        config overrides (solver or refiner parameters) cycled over the runs;
+        runs without overrides share one ILP solve. With `workers` > 1 the runs
+        are spread over a process pool. The result is `generate()`'s for the best
+        run plus `runs` (seed, fitness per run) and `fitness_spread`.
+        """
+        self._started = time.time()
+        self._emit("load")
+        context = self._load_context()
+        error = self._context_error(context)
+        if error:
+            return {"success": False, "error": error}
+
+        self._emit("bound_analysis", sessions=len(context["sessions"]))
+        bound_report = self._run_bound_analyzer(context)
+        if not bound_report["feasible"]:
+            return {
+                "success": False,
+                "error": "Bound analysis failed – please review constraints.",
+                "warnings": bound_report["warnings"],
+            }
+
+        variants = list(variants or [{}])
+        run_configs = [{**self.config, **variants[run % len(variants)]} for run in range(n)]
+        seeds = [self.random.randint(1, 999_999) for _ in range(n)]
+
+        shared_ilp = None
+        if any(config == self.config for config in run_configs):
+            self._emit("ilp", status="started", solver=self.solver_name)
+            shared_ilp = self._solve_with_ilp(context)
+            if not shared_ilp["success"]:
+                return {"success": False, "error": shared_ilp["error"],
+                        "warnings": bound_report["warnings"] + shared_ilp.get("warnings", [])}
+            shared_ilp["session_candidates"] = self._index_assignment_candidates(shared_ilp["session_candidates"])
+        run_ilps = [shared_ilp if config == self.config else None for config in run_configs]
+
+        self._emit("refine", status="started", runs=n)
+        if workers > 1 and n > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, n)) as executor:
+                outcomes = list(executor.map(_generate_seed, run_configs, seeds, [context] * n, run_ilps))
+        else:
+            outcomes = []
+            for config, seed, ilp_result in zip(run_configs, seeds, run_ilps):
+                outcomes.append(_generate_seed(config, seed, context, ilp_result))
+                if outcomes[-1]["success"]:
+                    self._emit("refine", run=len(outcomes), best_fitness=outcomes[-1]["fitness"])
+                if self._cancelled.is_set():
+                    break
+
+        runs = [
+            {"seed": seed, "fitness": outcome.get("fitness"), "variant": variants[run % len(variants)]}
+            for run, (seed, outcome) in enumerate(zip(seeds, outcomes))
+        ]
+        succeeded = [outcome for outcome in outcomes if outcome["success"]]
+        if not succeeded:
+            return {"success": False, "error": outcomes[0]["error"], "runs": runs,
+                    "warnings": bound_report["warnings"] + outcomes[0]["warnings"]}
+
+        best = min(succeeded, key=lambda outcome: outcome["fitness"])
+        best["warnings"] = self.notices + bound_report["warnings"] + best["warnings"]
+        scores = [outcome["fitness"] for outcome in succeeded]
+        result = self._finish(best, context)
+        result["runs"] = runs
+        result["fitness_spread"] = {
+            "best": min(scores),
+            "median": median(scores),
+            "worst": max(scores),
+            "stdev": round(pstdev(scores), 2),
+        }
+        return result
+
+    def _context_error(self, context):
+        if not context["courses"]:
+            return "No courses found. Please add courses first."
+        if not context["faculty"]:
+            return "No faculty found. Please add faculty first."
+        if not context["rooms"]:
+            return "No rooms found. Please add rooms first."
+        if not context["time_slots"]:
+            return "No time slots found. Please configure time slots."
+        return self._solver_error()
+
+    def _generate_assignments(self, context, ilp_result=None):
+        """ILP (unless a solved `ilp_result` is given), refinement and overwork detection"""
+        if ilp_result is None:
+            # Constraint 2 & 3: ILP with lab priority and availability focus
+            self._emit("ilp", status="started", solver=self.solver_name)
+            ilp_result = self._solve_with_ilp(context)
+        warnings = list(ilp_result.get("warnings", []))
         if not ilp_result["success"]:
             return {"success": False, "error": ilp_result["error"], "warnings": warnings}
+        if self._cancelled.is_set():
+            return {"success": False, "cancelled": True, "error": "Generation cancelled.", "warnings": warnings}
 
         # Constraints 4-8: GA refinement with enhanced constraints
-        ga_result = self._refine_with_genetic_algorithm(
+        self._emit("refine", status="started", fitness=self._fitness(ilp_result["assignments"], context))
+        ga_result = self._refine(
             context,
             ilp_result["assignments"],
             ilp_result.get("session_candidates", {}),
@@ -95,22 +1336,237 @@ class TimetableGenerator:
         final_assignments = ga_result.get("assignments", ilp_result["assignments"])
 
         # Constraint 9: Overwork detection
-        overwork_warnings = self._detect_overwork(final_assignments, context)
-        warnings.extend(overwork_warnings)
+        warnings.extend(self._detect_overwork(final_assignments, context))
+        return {
+            "success": True,
+            "assignments": final_assignments,
+            "warm_start_hints": ilp_result.get("warm_start_hints", 0),
+            "warnings": warnings,
+        }
+
+    def _finish(self, outcome, context):
+        """Per-faculty schedules, then persist the generated timetable"""
+        final_assignments = outcome["assignments"]
+        warnings = outcome["warnings"]
 
         # Constraint 7: Generate per-faculty daily schedules
         faculty_schedules = self._generate_faculty_schedules(final_assignments, context)
-        
-        entries_created = self._persist_assignments(final_assignments, context)
-        
+
+        kept = self._count_kept_assignments(final_assignments, context)
+        if self._cancelled.is_set():
+            return {"success": False, "cancelled": True, "error": "Generation cancelled.", "warnings": warnings}
+        # The stored timetable allows one entry per student group and slot
+        double_booked = self._double_booked_group_slots(final_assignments)
+        if double_booked:
+            return {
+                "success": False,
+                "error": f"The generated timetable books {double_booked} student group slot(s) twice; "
+                         "the stored timetable was kept.",
+                "warnings": warnings,
+            }
+        self._emit("persist", entries=len(final_assignments))
+        try:
+            entries_created = self._persist_assignments(final_assignments, context)
+        except DuplicateKeyError as e:
+            return {"success": False, "error": f"Could not save the generated timetable: {e}", "warnings": warnings}
+
         return {
             "success": True,
             "entries_created": entries_created,
+            "previous_entries": sum(sum(c.values()) for c in context["previous_assignments"].values()),
+            "warm_start_hints": outcome["warm_start_hints"],
+            "kept_assignments": kept,
             "warnings": warnings,
             "faculty_schedules": faculty_schedules,
             "overwork_alerts": [w for w in warnings if "overwork" in w.lower()]
         }
 
+    def generate_incremental(self, faculty_ids=(), course_ids=(), room_ids=()):
+        """
+        Repair the stored timetable after changes to a few faculty, courses or rooms.
+
+        Stored entries that touch none of the changed entities and are still
+        valid (eligible, available, clash-free) stay fixed. The remaining
+        sessions, plus `incremental_ring` rings of neighbours sharing their
+        slots, are re-optimized by an ILP around the fixed assignments, and only
+        the changed entries are written back. Without a stored timetable this
+        falls back to `generate()`.
+        """
+        context = self._load_context()
+        if not context["stored_entries"]:
+            return self.generate()
+        solver_error = self._solver_error()
+        if solver_error:
+            return {"success": False, "error": solver_error}
+
+        faculty_ids, course_ids, room_ids = set(faculty_ids), set(course_ids), set(room_ids)
+        sessions_by_pair = defaultdict(list)
+        for session in context["sessions"]:
+            sessions_by_pair[(session.course_id, session.student_group)].append(session)
+        entries_by_pair = defaultdict(list)
+        for entry in context["stored_entries"]:
+            entries_by_pair[(entry.course_id, entry.student_group)].append(entry)
+
+        # Pair stored entries with sessions; surplus entries are removed
+        entry_for_session = {}
+        removed = []
+        for pair, entries in entries_by_pair.items():
+            pair_sessions = sessions_by_pair.get(pair, [])
+            entry_for_session.update((s.id, e) for s, e in zip(pair_sessions, entries))
+            removed.extend(entries[len(pair_sessions):])
+
+        def bookings(assignment):
+            slot_id = assignment["slot_id"]
+            return {("f", assignment["faculty_id"], slot_id), ("r", assignment["room_id"], slot_id),
+                    ("g", assignment["group"], slot_id)}
+
+        # Keep every valid entry clear of the change set; free the rest
+        fixed = {}
+        booked = set()
+        for session in context["sessions"]:
+            entry = entry_for_session.get(session.id)
+            if entry is None or session.course_id in course_ids:
+                continue
+            if entry.faculty_id in faculty_ids or entry.room_id in room_ids:
+                continue
+            eligibility = context["eligibility"].get(session.course_id)
+            ordinal = context["slot_ordinal"].get(entry.time_slot_id)
+            if eligibility is None or ordinal is None:
+                continue
+            if entry.faculty_id not in eligibility["faculty_ids"] or entry.room_id not in eligibility["room_ids"]:
+                continue
+            if not eligibility["faculty_slot_masks"][entry.faculty_id] >> ordinal & 1:
+                continue
+            assignment = {
+                "session_id": session.id,
+                "faculty_id": entry.faculty_id,
+                "room_id": entry.room_id,
+                "slot_id": entry.time_slot_id,
+                "group": session.student_group,
+                "course_id": session.course_id,
+                "course_code": session.course_code,
+                "is_lab": session.is_lab,
+            }
+            keys = bookings(assignment)
+            if booked & keys:
+                continue
+            booked.update(keys)
+            fixed[session.id] = assignment
+        free = [session for session in context["sessions"] if session.id not in fixed]
+
+        # Neighbour rings: fixed sessions in a freed session's slot holding one of
+        # its eligible faculty or rooms are released as well
+        for _ in range(self.incremental_ring):
+            released = []
+            for session in free:
+                entry = entry_for_session.get(session.id)
+                eligibility = context["eligibility"].get(session.course_id)
+                if entry is None or eligibility is None:
+                    continue
+                for sid, assignment in fixed.items():
+                    if assignment["slot_id"] != entry.time_slot_id:
+                        continue
+                    if assignment["faculty_id"] in eligibility["faculty_ids"] or assignment["room_id"] in eligibility["room_ids"]:
+                        released.append(sid)
+            if not released:
+                break
+            for sid in set(released):
+                assignment = fixed.pop(sid)
+                booked -= bookings(assignment)
+            free = [session for session in context["sessions"] if session.id not in fixed]
+
+        warnings = []
+        problem = pulp.LpProblem("TimetableIncremental", pulp.LpMinimize)
+        session_candidates = {}
+        for session in free:
+            course = context["course_by_id"][session.course_id]
+            eligible_faculty, eligible_rooms = self._eligible_resources(course.id, context)
+            candidates = self._build_candidates(
+                f"s{session.id}", course, session.student_group, session.course_code, session.is_lab,
+                eligible_faculty, eligible_rooms, context, booked=booked,
+            )
+            if not candidates:
+                warnings.append(f"⚠️ No valid candidates for session {session.id} of {course.code}")
+                continue
+            session_candidates[session.id] = candidates
+            if self.config.get('maximize_fill', False):
+                problem += _unit_sum(c["var"] for c in candidates) <= 1, f"session_{session.id}_opt"
+            else:
+                problem += _unit_sum(c["var"] for c in candidates) == 1, f"session_{session.id}"
+
+        primary_terms, quality_terms = self._add_shared_constraints(
+            problem, session_candidates.values(), context, fixed=list(fixed.values())
+        )
+        hinted, stability_terms = self._warm_start(((c, 1) for c in session_candidates.values()), context)
+        if session_candidates:
+            status = self._solve_problem(problem, primary_terms, quality_terms + stability_terms, warm_start=hinted > 0)
+            if status != pulp.LpStatusOptimal:
+                return {
+                    "success": False,
+                    "error": f"ILP solver failed with status: {pulp.LpStatus[status]}",
+                    "warnings": warnings,
+                }
+
+        assignments = dict(fixed)
+        for session_id, candidates in session_candidates.items():
+            for candidate in candidates:
+                if pulp.value(candidate["var"]) > 0.5:
+                    assignments[session_id] = self._assignment_from_candidate(session_id, candidate)
+        final_assignments = list(assignments.values())
+        warnings.extend(self._detect_overwork(final_assignments, context))
+        if self._cancelled.is_set():
+            return {"success": False, "cancelled": True, "error": "Generation cancelled.", "warnings": warnings}
+
+        # Persist only the difference to the stored timetable
+        added = updated = kept = 0
+        for session in context["sessions"]:
+            entry = entry_for_session.get(session.id)
+            assignment = assignments.get(session.id)
+            if assignment is None:
+                if entry is not None:
+                    removed.append(entry)
+                continue
+            if entry is None:
+                self.db.session.add(TimetableEntry(
+                    course_id=assignment["course_id"],
+                    faculty_id=assignment["faculty_id"],
+                    room_id=assignment["room_id"],
+                    time_slot_id=assignment["slot_id"],
+                    student_group=assignment["group"],
+                ))
+                added += 1
+            elif (entry.faculty_id, entry.room_id, entry.time_slot_id) != (
+                assignment["faculty_id"], assignment["room_id"], assignment["slot_id"]
+            ):
+                entry.faculty_id = assignment["faculty_id"]
+                entry.room_id = assignment["room_id"]
+                entry.time_slot_id = assignment["slot_id"]
+                # Flush deletes before it saves, so moved entries are re-inserted
+                # only after all of them left their old slots (unique slot/group index)
+                self.db.session.delete(entry)
+                self.db.session.add(entry)
+                updated += 1
+            else:
+                kept += 1
+        for entry in removed:
+            self.db.session.delete(entry)
+        try:
+            self.db.session.commit()
+        except DuplicateKeyError as e:
+            self.db.session.rollback()
+            return {"success": False, "error": f"Could not save the repaired timetable: {e}", "warnings": warnings}
+
+        return {
+            "success": True,
+            "reoptimized_sessions": len(free),
+            "entries_created": added,
+            "entries_updated": updated,
+            "entries_removed": len(removed),
+            "kept_assignments": kept,
+            "warnings": warnings,
+            "overwork_alerts": [w for w in warnings if "overwork" in w.lower()],
+        }
+
     # --------------------------------------------------------------------- #
     # Context Preparation
     # --------------------------------------------------------------------- #
@@ -141,7 +1597,14 @@ class TimetableGenerator:
         for day in slots_by_day:
             slots_by_day[day].sort(key=lambda s: s.period)
 
-        faculty_availability = self._build_faculty_availability_map(faculty, slot_by_id)
+        # Dense slot ordinals: availability and occupancy are integer bitsets over them
+        slot_ordinal = {slot.id: idx for idx, slot in enumerate(time_slots)}
+        adjacent_slot_mask = 0
+        for idx, (slot, following) in enumerate(zip(time_slots, time_slots[1:])):
+            if slot.day == following.day and following.period == slot.period + 1:
+                adjacent_slot_mask |= 1 << idx
+
+        faculty_slot_masks = self._build_faculty_availability_map(faculty, time_slots)
         faculty_expertise = self._build_faculty_expertise_map(faculty)
         
         # Enhanced: Track faculty seniority (for constraint 6)
@@ -150,22 +1613,39 @@ class TimetableGenerator:
         sessions = self._build_sessions(courses, student_groups)
         room_capabilities = self._build_room_capabilities(rooms)
 
+        eligibility = self._build_eligibility_index(
+            courses, faculty, rooms, faculty_expertise, room_capabilities, faculty_slot_masks
+        )
+
+        # Stored timetable, used as a MIP start and to report what was kept
+        stored_entries = TimetableEntry.query.all()
+        previous_assignments: Dict[Tuple[int, str], Counter] = defaultdict(Counter)
+        for entry in stored_entries:
+            key = (entry.faculty_id, entry.room_id, entry.time_slot_id)
+            previous_assignments[(entry.course_id, entry.student_group)][key] += 1
+
         return {
             "courses": courses,
             "course_by_id": {course.id: course for course in courses},
             "faculty": faculty,
             "faculty_by_id": {f.id: f for f in faculty},
             "rooms": rooms,
+            "room_by_id": {room.id: room for room in rooms},
             "time_slots": time_slots,
             "slot_by_id": slot_by_id,
             "slots_by_day": slots_by_day,
             "student_groups": student_groups,
             "sessions": sessions,
-            "faculty_availability": faculty_availability,
             "faculty_expertise": faculty_expertise,
             "faculty_seniority": faculty_seniority,
             "max_periods_per_day_per_group": max_per_day_for_group,
             "room_capabilities": room_capabilities,
+            "slot_ordinal": slot_ordinal,
+            "adjacent_slot_mask": adjacent_slot_mask,
+            "faculty_slot_masks": faculty_slot_masks,
+            "eligibility": eligibility,
+            "stored_entries": stored_entries,
+            "previous_assignments": dict(previous_assignments),
         }
 
     def _estimate_faculty_seniority(self, faculty_list: List[Faculty]) -> Dict[int, float]:
@@ -193,12 +1673,21 @@ class TimetableGenerator:
         
         return seniority
 # branch
-    def _build_faculty_availability_map(self, faculty_list: List[Faculty], slot_by_id: Dict[int, TimeSlot]):
-        """Constraint 3: Build availability map with preference scoring"""
+    def _build_faculty_availability_map(self, faculty_list: List[Faculty], time_slots: List[TimeSlot]):
+        """
+        Constraint 3: Build availability map with preference scoring.
+
+        Availability is an integer bitset per faculty member; bit ``i`` refers to
+        ``time_slots[i]``.
+        """
+        all_slots = (1 << len(time_slots)) - 1
+        ordinal_by_day_period = {
+            (slot.day.lower(), slot.period): idx for idx, slot in enumerate(time_slots)
+        }
         availability = {}
         for faculty in faculty_list:
             if not faculty.availability:
-                availability[faculty.id] = set(slot_by_id.keys())
+                availability[faculty.id] = all_slots
                 continue
             raw_avail = faculty.availability
             # Normalize availability into a dict: if malformed -> allow all slots
@@ -211,10 +1700,10 @@ class TimetableGenerator:
                         raise TypeError('Non-string availability payload')
                     availability_json = json.loads(raw_avail) if raw_avail.strip() else {}
                 except (json.JSONDecodeError, TypeError, ValueError):
-                    availability[faculty.id] = set(slot_by_id.keys())
+                    availability[faculty.id] = all_slots
                     continue
 
-            allowed_slots: Set[int] = set()
+            allowed_mask = 0
             for day, periods in availability_json.items():
                 if not isinstance(periods, (list, tuple)):
                     periods = periods.get("periods", [])
@@ -228,11 +1717,13 @@ class TimetableGenerator:
                         except (TypeError, ValueError):
                             continue
 
-                for slot in slot_by_id.values():
-                    if slot.day.lower() == day.lower() and slot.period in normalized_periods:
-                        allowed_slots.add(slot.id)
+                day_key = day.lower()
+                for period in normalized_periods:
+                    idx = ordinal_by_day_period.get((day_key, period))
+                    if idx is not None:
+                        allowed_mask |= 1 << idx
 
-            availability[faculty.id] = allowed_slots if allowed_slots else set(slot_by_id.keys())
+            availability[faculty.id] = allowed_mask if allowed_mask else all_slots
 
         return availability
 
@@ -290,6 +1781,37 @@ class TimetableGenerator:
                     session_id += 1
         return sessions
 
+    def _build_eligibility_index(self, courses, faculty, rooms, faculty_expertise, room_capabilities, faculty_slot_masks):
+        """
+        Resolve expertise and room requirements once per course.
+
+        Each entry holds the eligible faculty ids, the eligible room ids, every
+        eligible faculty member's available-slot bitset and their union. The bound
+        analyzer, the ILP builders and the diagnostics all read from this index.
+        """
+        index = {}
+        for course in courses:
+            eligible_faculty = self._faculty_for_course(course, faculty, faculty_expertise)
+            eligible_rooms = self._rooms_for_course(course, rooms, room_capabilities)
+            slot_masks = {f.id: faculty_slot_masks.get(f.id, 0) for f in eligible_faculty}
+            union_mask = 0
+            for mask in slot_masks.values():
+                union_mask |= mask
+            index[course.id] = {
+                "faculty_ids": [f.id for f in eligible_faculty],
+                "room_ids": [room.id for room in eligible_rooms],
+                "faculty_slot_masks": slot_masks,
+                "slot_mask": union_mask,
+            }
+        return index
+
+    def _eligible_resources(self, course_id, context):
+        """Eligible faculty and room objects for a course, read from the eligibility index"""
+        entry = context["eligibility"][course_id]
+        eligible_faculty = [context["faculty_by_id"][fid] for fid in entry["faculty_ids"]]
+        eligible_rooms = [context["room_by_id"][rid] for rid in entry["room_ids"]]
+        return eligible_faculty, eligible_rooms
+
     # --------------------------------------------------------------------- #
     # Bound Analyzer (Constraint 1)
     # --------------------------------------------------------------------- #
@@ -326,7 +1848,7 @@ class TimetableGenerator:
 
         # Constraint 3: Validate faculty availability coverage
         for faculty in context["faculty"]:
-            available_slots = len(context["faculty_availability"].get(faculty.id, set()))
+            available_slots = context["faculty_slot_masks"].get(faculty.id, 0).bit_count()
             if available_slots < faculty.min_hours_per_week:
                 warnings.append(
                     f"⚠️ {faculty.name} has only {available_slots} available slots but requires {faculty.min_hours_per_week} hours minimum"
@@ -334,28 +1856,20 @@ class TimetableGenerator:
 
         # Enhanced check: ensure each faculty has enough possible session assignments
         # (considering expertise, eligible rooms and availability) to meet their minimum hours
-        sessions = context.get("sessions", [])
-        for faculty in context["faculty"]:
-            possible_session_count = 0
-            avail_slots = context["faculty_availability"].get(faculty.id, set())
-            for session in sessions:
-                course = context["course_by_id"].get(session.course_id)
-                if not course:
-                    continue
-                # Check faculty expertise eligibility
-                eligible_faculty = self._faculty_for_course(course, [faculty], context.get("faculty_expertise", {}))
-                if not eligible_faculty:
-                    continue
-
-                # Check for at least one eligible room for this course
-                eligible_rooms = self._rooms_for_course(course, context.get("rooms", []), context.get("room_capabilities", {}))
-                if not eligible_rooms:
-                    continue
-
-                # Check if there exists at least one timeslot where faculty is available
-                if any(slot.id in avail_slots for slot in context.get("time_slots", [])):
-                    possible_session_count += 1
+        sessions_per_course = defaultdict(int)
+        for session in context.get("sessions", []):
+            sessions_per_course[session.course_id] += 1
+        teachable = defaultdict(int)
+        for course_id, count in sessions_per_course.items():
+            entry = context["eligibility"].get(course_id)
+            if not entry or not entry["room_ids"]:
+                continue
+            for faculty_id, slot_mask in entry["faculty_slot_masks"].items():
+                if slot_mask:
+                    teachable[faculty_id] += count
 
+        for faculty in context["faculty"]:
+            possible_session_count = teachable.get(faculty.id, 0)
             if possible_session_count < (faculty.min_hours_per_week or 0):
                 warnings.append(
                     f"⚠️ Feasibility Issue: {faculty.name} can teach at most {possible_session_count} sessions but requires {faculty.min_hours_per_week} minimum"
@@ -371,17 +1885,25 @@ class TimetableGenerator:
     # --------------------------------------------------------------------- #
     def _solve_with_ilp(self, context):
         """Enhanced ILP with lab priority and availability focus"""
+        if self.ilp_components and "component" not in context:
+            components = self._conflict_components(context)
+            if len(components) > 1:
+                return self._solve_components(context, components)
+
+        mode = self.config.get('ilp_mode', 'expanded')
+        if mode == 'aggregated':
+            return self._solve_with_aggregated_ilp(context)
+
         warnings = []
         problem = pulp.LpProblem("Timetable", pulp.LpMinimize)
+        match_rooms = self.config.get('room_assignment', 'ilp') == 'matching'
         
         # Build candidates for each session
         session_candidates = {}
-        decision_vars = {}
         
         for session in context["sessions"]:
             course = context["course_by_id"][session.course_id]
-            eligible_faculty = self._faculty_for_course(course, context["faculty"], context["faculty_expertise"])
-            eligible_rooms = self._rooms_for_course(course, context["rooms"], context["room_capabilities"])
+            eligible_faculty, eligible_rooms = self._eligible_resources(course.id, context)
             
             if not eligible_faculty:
                 warnings.append(f"⚠️ No faculty available for course {course.code}")
@@ -390,43 +1912,10 @@ class TimetableGenerator:
                 warnings.append(f"⚠️ No suitable rooms for course {course.code}")
                 continue
             
-            candidates = []
-            for faculty in eligible_faculty:
-                # Constraint 3: Only consider available timeslots
-                available_slots = context["faculty_availability"].get(faculty.id, set())
-                
-                for room in eligible_rooms:
-                    for slot in context["time_slots"]:
-                        # Skip if faculty not available
-                        if slot.id not in available_slots:
-                            continue
-                        
-                        var_name = f"s{session.id}_f{faculty.id}_r{room.id}_t{slot.id}"
-                        var = pulp.LpVariable(var_name, cat="Binary")
-                        decision_vars[var_name] = var
-                        
-                        # Constraint 2 & 6: Calculate priority score
-                        priority_score = 0
-                        if session.is_lab:
-                            priority_score += self.lab_priority_weight
-                        
-                        # Constraint 6: Prefer early/preferred slots for senior faculty
-                        if self.senior_faculty_preference:
-                            seniority = context["faculty_seniority"].get(faculty.id, 0.5)
-                            if seniority > 0.7 and slot.period <= 3:  # Morning slots for senior
-                                priority_score -= 10
-                        
-                        candidates.append({
-                            "var": var,
-                            "faculty_id": faculty.id,
-                            "room_id": room.id,
-                            "slot_id": slot.id,
-                            "group": session.student_group,
-                            "course_id": course.id,
-                            "course_code": session.course_code,
-                            "is_lab": session.is_lab,
-                            "priority": priority_score
-                        })
+            candidates = self._build_candidates(
+                f"s{session.id}", course, session.student_group, session.course_code, session.is_lab,
+                eligible_faculty, eligible_rooms, context, with_rooms=not match_rooms,
+            )
             
             if not candidates:
                 warnings.append(f"⚠️ No valid candidates for session {session.id} of {course.code}")
@@ -437,127 +1926,625 @@ class TimetableGenerator:
             # Constraint: Each session assigned exactly once
             # If `maximize_fill` config is set, allow session to be unassigned (<=1)
             if self.config.get('maximize_fill', False):
-                problem += pulp.lpSum(c["var"] for c in candidates) <= 1, f"session_{session.id}_opt"
+                problem += _unit_sum(c["var"] for c in candidates) <= 1, f"session_{session.id}_opt"
             else:
-                problem += pulp.lpSum(c["var"] for c in candidates) == 1, f"session_{session.id}"
+                problem += _unit_sum(c["var"] for c in candidates) == 1, f"session_{session.id}"
         
-        # Constraint: No faculty/room/group conflicts per timeslot
+        primary_terms, quality_terms = self._add_shared_constraints(problem, session_candidates.values(), context)
+        hinted, stability_terms = self._warm_start(((c, 1) for c in session_candidates.values()), context)
+        
+        # Solve
+        status = self._solve_problem(problem, primary_terms, quality_terms + stability_terms, warm_start=hinted > 0)
+        
+        if status != pulp.LpStatusOptimal:
+            return {
+                "success": False,
+                "error": f"ILP solver failed with status: {pulp.LpStatus[status]}",
+                "warnings": warnings
+            }
+        
+        # Extract assignments
+        assignments = []
+        for session_id, candidates in session_candidates.items():
+            for candidate in candidates:
+                if pulp.value(candidate["var"]) > 0.5:
+                    assignments.append(self._assignment_from_candidate(session_id, candidate))
+
+        if match_rooms:
+            room_error = self._assign_rooms_by_matching(assignments, context)
+            if room_error:
+                return {"success": False, "error": room_error, "warnings": warnings}
+            session_candidates = self._with_room_choices(session_candidates)
+        
+        return {
+            "success": True,
+            "assignments": assignments,
+            "warnings": warnings,
+            "session_candidates": session_candidates,
+            "warm_start_hints": hinted,
+        }
+
+    def _conflict_components(self, context):
+        """
+        Split the sessions into connected components of the conflict graph.
+
+        Two course/group pairs are linked when they share the group, an eligible
+        faculty member or an eligible room. No constraint spans two components,
+        so each can be solved as its own ILP. Returns lists of sessions.
+        """
+        parent = {}
+
+        def find(node):
+            parent.setdefault(node, node)
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        def union(a, b):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+        for session in context["sessions"]:
+            pair = ("pair", session.course_id, session.student_group)
+            if pair in parent:
+                continue
+            union(pair, ("g", session.student_group))
+            eligibility = context["eligibility"].get(session.course_id, {})
+            for faculty_id in eligibility.get("faculty_ids", ()):
+                union(pair, ("f", faculty_id))
+            for room_id in eligibility.get("room_ids", ()):
+                union(pair, ("r", room_id))
+
+        components = defaultdict(list)
+        for session in context["sessions"]:
+            components[find(("pair", session.course_id, session.student_group))].append(session)
+        return list(components.values())
+
+    def _solve_components(self, context, components):
+        """Solve each component as its own ILP, in a process pool with `ilp_workers` > 1, and merge"""
+        sub_contexts = []
+        for idx, sessions in enumerate(components):
+            groups = {session.student_group for session in sessions}
+            sub_context = {key: value for key, value in context.items() if key != "stored_entries"}
+            sub_context.update(
+                component=idx,
+                sessions=sessions,
+                student_groups=[group for group in context["student_groups"] if group.name in groups],
+                previous_assignments={
+                    pair: keys for pair, keys in context["previous_assignments"].items() if pair[1] in groups
+                },
+            )
+            sub_contexts.append(sub_context)
+
+        if self.ilp_workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.ilp_workers, len(sub_contexts))) as executor:
+                results = list(executor.map(_solve_ilp_component, [self.config] * len(sub_contexts), sub_contexts))
+        else:
+            results = [self._solve_with_ilp(sub_context) for sub_context in sub_contexts]
+
+        merged = {
+            "success": True,
+            "assignments": [],
+            "warnings": [],
+            "session_candidates": {},
+            "warm_start_hints": 0,
+            "components": len(components),
+        }
+        for result in results:
+            merged["warnings"].extend(result.get("warnings", []))
+            if not result["success"]:
+                return {"success": False, "error": result["error"], "warnings": merged["warnings"]}
+            merged["assignments"].extend(result["assignments"])
+            merged["session_candidates"].update(result["session_candidates"])
+            merged["warm_start_hints"] += result.get("warm_start_hints", 0)
+        return merged
+
+    def _solve_with_aggregated_ilp(self, context):
+        """
+        Aggregated ILP: one binary per (course, group, faculty, room, slot).
+
+        The hour-sessions of a course/group pair are interchangeable, so instead of
+        one symmetric copy of every variable per weekly hour, each pair gets a single
+        block of variables whose sum must equal its weekly hours. The chosen slots
+        are expanded back onto the original sessions afterwards.
+        """
+        warnings = []
+        problem = pulp.LpProblem("TimetableAggregated", pulp.LpMinimize)
+        match_rooms = self.config.get('room_assignment', 'ilp') == 'matching'
+
+        sessions_by_pair: Dict[Tuple[int, str], List[Session]] = defaultdict(list)
+        for session in context["sessions"]:
+            sessions_by_pair[(session.course_id, session.student_group)].append(session)
+        group_index = {group.name: idx for idx, group in enumerate(context["student_groups"])}
+
+        pair_candidates = {}
+        for (course_id, group_name), pair_sessions in sessions_by_pair.items():
+            course = context["course_by_id"][course_id]
+            first = pair_sessions[0]
+            eligible_faculty, eligible_rooms = self._eligible_resources(course.id, context)
+
+            if not eligible_faculty:
+                warnings.append(f"⚠️ No faculty available for course {course.code}")
+                continue
+            if not eligible_rooms:
+                warnings.append(f"⚠️ No suitable rooms for course {course.code}")
+                continue
+
+            prefix = f"c{course_id}_g{group_index.get(group_name, len(group_index))}"
+            candidates = self._build_candidates(
+                prefix, course, group_name, first.course_code, first.is_lab,
+                eligible_faculty, eligible_rooms, context, with_rooms=not match_rooms,
+            )
+            if not candidates:
+                warnings.append(f"⚠️ No valid candidates for {course.code} ({group_name})")
+                continue
+
+            pair_candidates[(course_id, group_name)] = candidates
+
+            # Constraint: each course/group pair receives exactly its weekly hours
+            hours = len(pair_sessions)
+            if self.config.get('maximize_fill', False):
+                problem += _unit_sum(c["var"] for c in candidates) <= hours, f"pair_{prefix}_opt"
+            else:
+                problem += _unit_sum(c["var"] for c in candidates) == hours, f"pair_{prefix}"
+
+        primary_terms, quality_terms = self._add_shared_constraints(problem, pair_candidates.values(), context)
+        hinted, stability_terms = self._warm_start(
+            ((c, len(sessions_by_pair[pair])) for pair, c in pair_candidates.items()), context
+        )
+        status = self._solve_problem(problem, primary_terms, quality_terms + stability_terms, warm_start=hinted > 0)
+
+        if status != pulp.LpStatusOptimal:
+            return {
+                "success": False,
+                "error": f"ILP solver failed with status: {pulp.LpStatus[status]}",
+                "warnings": warnings
+            }
+
+        # Expand each pair's chosen slots back onto its individual sessions
+        assignments = []
+        session_candidates = {}
+        for pair, candidates in pair_candidates.items():
+            chosen = [c for c in candidates if pulp.value(c["var"]) > 0.5]
+            pair_sessions = sessions_by_pair[pair]
+            for session, candidate in zip(pair_sessions, chosen):
+                assignments.append(self._assignment_from_candidate(session.id, candidate))
+            for session in pair_sessions:
+                session_candidates[session.id] = candidates
+
+        if match_rooms:
+            room_error = self._assign_rooms_by_matching(assignments, context)
+            if room_error:
+                return {"success": False, "error": room_error, "warnings": warnings}
+            session_candidates = self._with_room_choices(session_candidates)
+
+        return {
+            "success": True,
+            "assignments": assignments,
+            "warnings": warnings,
+            "session_candidates": session_candidates,
+            "warm_start_hints": hinted,
+        }
+
+    def _build_candidates(self, prefix, course, group_name, course_code, is_lab, eligible_faculty, eligible_rooms,
+                          context, create_vars=True, with_rooms=True, booked=None):
+        """
+        Create one binary per eligible (faculty, room, slot) with its priority score.
+
+        With ``with_rooms=False`` the room dimension is left out: candidates carry
+        the eligible ``room_class`` instead and rooms are matched after the solve.
+        ``booked`` holds ("f"|"r"|"g", id, slot_id) keys already taken by fixed
+        assignments; candidates using any of them are skipped.
+        """
+        candidates = []
+        room_class = frozenset(room.id for room in eligible_rooms)
+        for faculty in eligible_faculty:
+            # Constraint 3: Only consider available timeslots
+            available_mask = context["faculty_slot_masks"].get(faculty.id, 0)
+            available_slots = [context["time_slots"][idx] for idx in _iter_bits(available_mask)]
+            if booked:
+                available_slots = [
+                    slot for slot in available_slots
+                    if ("f", faculty.id, slot.id) not in booked and ("g", group_name, slot.id) not in booked
+                ]
+
+            # Constraint 2 & 6: priority depends on faculty and slot only, not the room
+            base_priority = self.lab_priority_weight if is_lab else 0
+            senior = (
+                self.senior_faculty_preference
+                and context["faculty_seniority"].get(faculty.id, 0.5) > 0.7
+            )
+            # Constraint 6: Prefer early/preferred slots for senior faculty
+            slot_priority = [
+                base_priority - 10 if senior and slot.period <= 3 else base_priority
+                for slot in available_slots
+            ]
+            
+            for room in (eligible_rooms if with_rooms else [None]):
+                room_part = f"_r{room.id}" if room is not None else ""
+                for slot, priority_score in zip(available_slots, slot_priority):
+                    if booked and room is not None and ("r", room.id, slot.id) in booked:
+                        continue
+                    
+                    var = None
+                    if create_vars:
+                        var = pulp.LpVariable(f"{prefix}_f{faculty.id}{room_part}_t{slot.id}", cat="Binary")
+                    
+                    candidates.append({
+                        "var": var,
+                        "faculty_id": faculty.id,
+                        "room_id": room.id if room is not None else None,
+                        "room_class": room_class,
+                        "slot_id": slot.id,
+                        "group": group_name,
+                        "course_id": course.id,
+                        "course_code": course_code,
+                        "is_lab": is_lab,
+                        "priority": priority_score
+                    })
+        return candidates
+
+    def _add_shared_constraints(self, problem, candidate_lists, context, fixed=()):
+        """
+        Conflict, daily-load, workload and lab constraints.
+
+        Returns the objective as (primary_terms, quality_terms): minimum-hours
+        slack and the fill reward first, then priority scores and, unless
+        `ilp_objective` is 'priority', the soft consecutive/daily-load penalties.
+        ``fixed`` assignments are not variables but count towards the daily,
+        workload and lab limits; the candidates must already avoid their bookings.
+        """
+        fixed_group_day = Counter()
+        fixed_faculty_hours = Counter()
+        fixed_lab_groups = set()
+        for assignment in fixed:
+            fixed_group_day[(assignment["group"], context["slot_by_id"][assignment["slot_id"]].day)] += 1
+            fixed_faculty_hours[assignment["faculty_id"]] += 1
+            if assignment["is_lab"]:
+                fixed_lab_groups.add(assignment["group"])
+
+        # Index every candidate once; each constraint row is then a sparse
+        # (variable, coefficient) list instead of a rescan of all candidates
+        soft = self.ilp_objective != 'priority'
+        slot_day = {slot.id: slot.day for slot in context["time_slots"]}
         faculty_slot_usage = defaultdict(list)
         room_slot_usage = defaultdict(list)
         group_slot_usage = defaultdict(list)
-        
-        for candidates in session_candidates.values():
+        room_class_usage = defaultdict(list)
+        group_day_usage = defaultdict(list)
+        group_lab_usage = defaultdict(list)
+        faculty_hours = defaultdict(list)
+        subject_slot_usage = defaultdict(lambda: defaultdict(list))
+        faculty_day_usage = defaultdict(list)
+        priority_terms = []
+        all_vars = []
+        for candidates in candidate_lists:
             for candidate in candidates:
-                faculty_slot_usage[(candidate["faculty_id"], candidate["slot_id"])].append(candidate["var"])
-                room_slot_usage[(candidate["room_id"], candidate["slot_id"])].append(candidate["var"])
-                group_slot_usage[(candidate["group"], candidate["slot_id"])].append(candidate["var"])
-        
+                var = candidate["var"]
+                slot_id = candidate["slot_id"]
+                day = slot_day[slot_id]
+                group_name = candidate["group"]
+                all_vars.append(var)
+                faculty_slot_usage[(candidate["faculty_id"], slot_id)].append(var)
+                if candidate["room_id"] is None:
+                    room_class_usage[(candidate["room_class"], slot_id)].append(var)
+                else:
+                    room_slot_usage[(candidate["room_id"], slot_id)].append(var)
+                group_slot_usage[(group_name, slot_id)].append(var)
+                group_day_usage[(group_name, day)].append(var)
+                faculty_hours[candidate["faculty_id"]].append(var)
+                if candidate["is_lab"]:
+                    group_lab_usage[group_name].append(var)
+                if candidate["priority"]:
+                    priority_terms.append((var, candidate["priority"]))
+                if soft:
+                    subject_slot_usage[(group_name, candidate["course_code"])][slot_id].append(var)
+                    faculty_day_usage[(candidate["faculty_id"], day)].append(var)
+
+        # Constraint: No faculty/room/group conflicts per timeslot
         for key, vars_list in faculty_slot_usage.items():
-            problem += pulp.lpSum(vars_list) <= 1, f"faculty_{key[0]}_slot_{key[1]}"
+            problem += _unit_sum(vars_list) <= 1, f"faculty_{key[0]}_slot_{key[1]}"
         for key, vars_list in room_slot_usage.items():
-            problem += pulp.lpSum(vars_list) <= 1, f"room_{key[0]}_slot_{key[1]}"
+            problem += _unit_sum(vars_list) <= 1, f"room_{key[0]}_slot_{key[1]}"
         for key, vars_list in group_slot_usage.items():
-            problem += pulp.lpSum(vars_list) <= 1, f"group_{key[0]}_slot_{key[1]}"
+            problem += _unit_sum(vars_list) <= 1, f"group_{key[0]}_slot_{key[1]}"
+        self._add_room_capacity_constraints(problem, room_class_usage)
 
         # Constraint: limit total periods per group per day (configurable)
         max_per_day = context.get('max_periods_per_day_per_group', 0) or None
         if max_per_day is not None:
-            # For each group + day, ensure assigned vars do not exceed the maximum
-            for group in context.get('student_groups', []):
-                for day, slots in context.get('slots_by_day', {}).items():
-                    day_vars = []
-                    slot_ids = {s.id for s in slots}
-                    for candidates in session_candidates.values():
-                        for c in candidates:
-                            if c['group'] == group.name and c['slot_id'] in slot_ids:
-                                day_vars.append(c['var'])
-                    if day_vars:
-                        problem += pulp.lpSum(day_vars) <= max_per_day, f"group_{group.name}_day_{day}_max"
+            group_names = {group.name for group in context.get('student_groups', [])}
+            for (group_name, day), day_vars in group_day_usage.items():
+                if group_name in group_names:
+                    limit = max_per_day - fixed_group_day[(group_name, day)]
+                    problem += _unit_sum(day_vars) <= limit, f"group_{group_name}_day_{day}_max"
         
         # Constraint 1: Faculty workload bounds
-        faculty_hours = defaultdict(list)
-        for candidates in session_candidates.values():
-            for candidate in candidates:
-                faculty_hours[candidate["faculty_id"]].append(candidate["var"])
-        
+        slack_vars = {}
         for faculty in context["faculty"]:
             if faculty.id in faculty_hours:
-                total = pulp.lpSum(faculty_hours[faculty.id])
+                total = _unit_sum(faculty_hours[faculty.id]) + fixed_faculty_hours[faculty.id]
                 # Make minimum-hours a soft constraint using a non-negative slack variable
-                slack_name = f"slack_faculty_{faculty.id}"
-                slack_var = pulp.LpVariable(slack_name, lowBound=0, cat="Continuous")
+                slack_var = pulp.LpVariable(f"slack_faculty_{faculty.id}", lowBound=0, cat="Continuous")
                 problem += total + slack_var >= faculty.min_hours_per_week, f"faculty_{faculty.id}_min_soft"
                 # Keep maximum as a hard constraint
                 problem += total <= faculty.max_hours_per_week, f"faculty_{faculty.id}_max"
-                # Store slack var on the faculty object for objective construction
-                faculty._min_slack_var = slack_var
+                slack_vars[faculty.id] = slack_var
         
         # Constraint 2: At least one lab per student group
         for group in context["student_groups"]:
-            lab_vars = []
-            for candidates in session_candidates.values():
-                for candidate in candidates:
-                    if candidate["is_lab"] and candidate["group"] == group.name:
-                        lab_vars.append(candidate["var"])
-            if lab_vars:
-                problem += pulp.lpSum(lab_vars) >= 1, f"group_{group.name}_min_lab"
+            if group.name in fixed_lab_groups:
+                continue
+            if group_lab_usage.get(group.name):
+                problem += _unit_sum(group_lab_usage[group.name]) >= 1, f"group_{group.name}_min_lab"
         
         # Objective: Penalize minimum-hours shortfall (slack) heavily, plus priority scores
-        objective_terms = []
         slack_penalty = self.config.get('min_violation_penalty', 1000)
-        for faculty in context["faculty"]:
-            if hasattr(faculty, '_min_slack_var'):
-                # Penalize any slack (hours shortfall) to prefer meeting minima when possible
-                objective_terms.append(slack_penalty * faculty._min_slack_var)
-        
-        # Add priority scores to objective
-        for candidates in session_candidates.values():
-            for candidate in candidates:
-                objective_terms.append(candidate["priority"] * candidate["var"])
+        # Penalize any slack (hours shortfall) to prefer meeting minima when possible
+        primary = [(slack_var, slack_penalty) for slack_var in slack_vars.values()]
 
         # If maximizing fill is enabled, add a negative reward for assigning any candidate
         # so that the minimization objective will try to assign as many sessions as possible
         if self.config.get('maximize_fill', False):
             assign_reward = -self.config.get('assign_reward', 50)
-            for candidates in session_candidates.values():
-                for candidate in candidates:
-                    objective_terms.append(assign_reward * candidate["var"]) 
-        
-        problem += pulp.lpSum(objective_terms)
-        
-        # Solve
-        solver = pulp.PULP_CBC_CMD(msg=0, timeLimit=60)
-        status = problem.solve(solver)
-        
-        if status != pulp.LpStatusOptimal:
-            return {
-                "success": False,
-                "error": f"ILP solver failed with status: {pulp.LpStatus[status]}",
-                "warnings": warnings
-            }
-        
-        # Extract assignments
-        assignments = []
-        for session_id, candidates in session_candidates.items():
+            primary.extend((var, assign_reward) for var in all_vars)
+        primary_terms = [pulp.LpAffineExpression(primary)]
+
+        # Add priority scores to objective
+        quality_terms = [pulp.LpAffineExpression(priority_terms)]
+
+        if soft:
+            quality_terms.extend(self._add_soft_penalties(problem, subject_slot_usage, faculty_day_usage, context))
+
+        return primary_terms, quality_terms
+
+    def _add_soft_penalties(self, problem, subject_slot_usage, faculty_day_usage, context):
+        """
+        Model the `_fitness` quality penalties with auxiliary variables.
+
+        `subject_slot_usage` maps (group, course code) to the variables placing it
+        in each slot and `faculty_day_usage` maps (faculty, day) to the variables
+        teaching on that day. A pair indicator per adjacent-period pair of a subject
+        and an excess variable per faculty-day are pushed up by their constraints
+        and down by the objective, so they can stay continuous.
+        """
+        terms = []
+        slot_ordinal = context["slot_ordinal"]
+        adjacent = context["adjacent_slot_mask"]
+        consecutive_weight = 10 * self.consecutive_penalty_weight
+
+        # Constraint 5: consecutive lectures of the same subject
+        if consecutive_weight:
+            for idx, by_slot in enumerate(subject_slot_usage.values()):
+                ordinals = {slot_ordinal[slot_id]: slot_id for slot_id in by_slot}
+                for ordinal, slot_id in ordinals.items():
+                    if not (adjacent >> ordinal) & 1 or ordinal + 1 not in ordinals:
+                        continue
+                    next_slot_id = ordinals[ordinal + 1]
+                    pair = pulp.LpVariable(f"consecutive_{idx}_t{slot_id}", lowBound=0, upBound=1)
+                    problem += (
+                        pair >= _unit_sum(by_slot[slot_id]) + _unit_sum(by_slot[next_slot_id]) - 1,
+                        f"consecutive_{idx}_t{slot_id}",
+                    )
+                    terms.append(consecutive_weight * pair)
+
+        # Constraint 7: daily balance, more than 6 hours a day for one faculty
+        for (faculty_id, day), day_vars in faculty_day_usage.items():
+            if len(day_vars) <= 6:
+                continue
+            excess = pulp.LpVariable(f"overload_faculty_{faculty_id}_{day}", lowBound=0)
+            problem += excess >= _unit_sum(day_vars) - 6, f"overload_faculty_{faculty_id}_{day}"
+            terms.append(5 * excess)
+        return terms
+
+    def _warm_start(self, candidate_lists, context):
+        """
+        Seed CBC with the stored timetable.
+
+        `candidate_lists` yields (candidates, slots) pairs, where `slots` is how
+        many stored entries of the list's course/group pair it can take (1 per
+        session list, the weekly hours for an aggregated pair list). Matching
+        candidates start at 1 and all others at 0; with rooms matched after the
+        solve a stored entry matches on faculty and slot alone. Returns the
+        number of hinted entries and the `stability_reward` objective terms.
+        """
+        if not self.warm_start or not context["previous_assignments"]:
+            return 0, []
+        pending = {pair: Counter(keys) for pair, keys in context["previous_assignments"].items()}
+        hinted = 0
+        terms = []
+        for candidates, slots in candidate_lists:
             for candidate in candidates:
-                if pulp.value(candidate["var"]) > 0.5:
-                    assignments.append({
-                        "session_id": session_id,
-                        "faculty_id": candidate["faculty_id"],
-                        "room_id": candidate["room_id"],
-                        "slot_id": candidate["slot_id"],
-                        "group": candidate["group"],
-                        "course_id": candidate["course_id"],
-                        "course_code": candidate["course_code"],
-                        "is_lab": candidate["is_lab"],
-                    })
-        
+                candidate["var"].setInitialValue(0)
+            if not candidates:
+                continue
+            remaining = pending.get((candidates[0]["course_id"], candidates[0]["group"]))
+            if not remaining:
+                continue
+            free_room = defaultdict(list)
+            for faculty_id, room_id, slot_id in remaining:
+                free_room[(faculty_id, slot_id)].append(room_id)
+            taken = 0
+            for candidate in candidates:
+                if taken == slots:
+                    break
+                key = (candidate["faculty_id"], candidate["room_id"], candidate["slot_id"])
+                if candidate["room_id"] is None:
+                    rooms = [r for r in free_room.get(key[::2], []) if remaining[(key[0], r, key[2])] > 0]
+                    if not rooms:
+                        continue
+                    key = (key[0], rooms[0], key[2])
+                if remaining[key] <= 0:
+                    continue
+                remaining[key] -= 1
+                candidate["var"].setInitialValue(1)
+                taken += 1
+                if self.stability_reward:
+                    terms.append(-self.stability_reward * candidate["var"])
+            hinted += taken
+        return hinted, terms
+
+    def _count_kept_assignments(self, assignments, context):
+        """How many assignments repeat a stored entry (course, group, faculty, room and slot)"""
+        pending = {pair: Counter(keys) for pair, keys in context["previous_assignments"].items()}
+        kept = 0
+        for assignment in assignments:
+            remaining = pending.get((assignment["course_id"], assignment["group"]))
+            key = (assignment["faculty_id"], assignment["room_id"], assignment["slot_id"])
+            if remaining and remaining[key] > 0:
+                remaining[key] -= 1
+                kept += 1
+        return kept
+
+    def _solve_problem(self, problem, primary_terms, quality_terms, warm_start=False):
+        """
+        Solve with the configured engine under the configured `ilp_objective`.
+
+        'priority' and 'weighted' minimise the sum of both parts in one solve.
+        'lexicographic' first minimises the primary part (minimum-hours slack and
+        fill), then bounds it by its optimum and minimises the quality part,
+        starting from the phase-1 solution.
+        """
+        if self.ilp_objective != 'lexicographic' or not primary_terms:
+            problem.setObjective(pulp.lpSum(primary_terms + quality_terms))
+            return self._run_solver(problem, warm_start)
+
+        problem.setObjective(pulp.lpSum(primary_terms))
+        status = self._run_solver(problem, warm_start)
+        if status != pulp.LpStatusOptimal:
+            return status
+        best = pulp.value(problem.objective) or 0
+        # An absolute slack is needed: CBC's preprocessing declares a bound of
+        # 1e-6 on the continuous slack variables infeasible.
+        tolerance = max(1e-3, 1e-6 * abs(best))
+        problem += pulp.lpSum(primary_terms) <= best + tolerance, "lexicographic_phase1_bound"
+        problem.setObjective(pulp.lpSum(quality_terms))
+        return self._run_solver(problem, warm_start=True)
+
+    def _run_solver(self, problem, warm_start=False):
+        backend = SOLVER_BACKENDS[self.solver_name]
+        time_limit = self.solver_time_limit
+        if isinstance(time_limit, dict):
+            time_limit = time_limit.get(self.solver_name, self.SOLVER_TIME_LIMITS[self.solver_name])
+        if self._accepted.is_set():
+            # Accepted before this solve started: only look for a first solution
+            time_limit = min(time_limit or 1, 1)
+        monitor = _SolveMonitor(self._emit, self._accepted) if self.progress is not None or self.interruptible else None
+        status = backend.solve(problem, time_limit, self.solver_threads, warm_start, self.accept_gap, monitor)
+        if monitor is not None:
+            self.notices.extend(notice for notice in monitor.notices if notice not in self.notices)
+        self._emit("ilp", status=pulp.LpStatus[status], objective=pulp.value(problem.objective))
+        return status
+
+    def _solver_error(self):
+        """Error message when the configured engine or ILP mode is unknown, unavailable or unsuited to each other"""
+        if self.solver_name not in SOLVER_BACKENDS:
+            return f"Unknown solver '{self.solver_name}'. Choose one of: {', '.join(SOLVER_BACKENDS)}."
+        if not SOLVER_BACKENDS[self.solver_name].available():
+            return f"Solver '{self.solver_name}' is not available in this environment."
+        mode = self.config.get('ilp_mode', 'expanded')
+        if mode not in self.ILP_MODES:
+            return f"Unknown ilp_mode '{mode}'. Choose one of: {', '.join(self.ILP_MODES)}."
+        if self.solver_name in self.AGGREGATED_ONLY_SOLVERS and mode != 'aggregated':
+            return (
+                f"Solver '{self.solver_name}' does not scale to ilp_mode '{mode}'. "
+                "Use ilp_mode 'aggregated' with it, or solver 'cbc'."
+            )
+        return None
+
+    def _assignment_from_candidate(self, session_id, candidate):
         return {
-            "success": True,
-            "assignments": assignments,
-            "warnings": warnings,
-            "session_candidates": session_candidates,
+            "session_id": session_id,
+            "faculty_id": candidate["faculty_id"],
+            "room_id": candidate["room_id"],
+            "slot_id": candidate["slot_id"],
+            "group": candidate["group"],
+            "course_id": candidate["course_id"],
+            "course_code": candidate["course_code"],
+            "is_lab": candidate["is_lab"],
+        }
+
+    def _add_room_capacity_constraints(self, problem, room_class_usage):
+        """
+        Aggregate room capacity per slot when rooms are matched after the solve.
+
+        ``room_class_usage`` maps (eligible room set, slot) to the variables of
+        sessions needing one of those rooms. These are the Hall conditions of the
+        per-slot matching: for every union of room sets, the sessions whose needs
+        fall entirely inside it cannot outnumber its rooms. Tag-derived room sets
+        overlap without nesting, so unions are needed; a union that splits into
+        disjoint parts is implied by their rows, so only unions of overlapping
+        sets get one. Past ROOM_UNION_LIMIT unions the rows are incomplete and
+        `_assign_rooms_by_matching` reports any slot left without a matching.
+        """
+        if not room_class_usage:
+            return
+        room_classes = {room_class for room_class, _ in room_class_usage}
+        unions, _ = _connected_unions(room_classes, self.ROOM_UNION_LIMIT)
+        room_class_list = sorted(unions, key=lambda union: (len(union), sorted(union)))
+        slot_ids = sorted({slot_id for _, slot_id in room_class_usage})
+        contained = {
+            outer: [inner for inner in room_classes if inner <= outer]
+            for outer in room_class_list
         }
+        for idx, outer in enumerate(room_class_list):
+            for slot_id in slot_ids:
+                vars_list = []
+                for inner in contained[outer]:
+                    vars_list.extend(room_class_usage.get((inner, slot_id), []))
+                if len(vars_list) > len(outer):
+                    problem += _unit_sum(vars_list) <= len(outer), f"room_class_{idx}_slot_{slot_id}"
+
+    def _assign_rooms_by_matching(self, assignments, context):
+        """
+        Give every assignment a concrete room with one bipartite matching per slot.
+
+        Room eligibility comes from the eligibility index, i.e. `_rooms_for_course`
+        (room type plus the required tag subset check). Returns an error naming
+        the sessions left without a room, or None when every session has one.
+        """
+        by_slot = defaultdict(list)
+        for assignment in assignments:
+            by_slot[assignment["slot_id"]].append(assignment)
+
+        unmatched = []
+        for slot_id, slot_assignments in by_slot.items():
+            adjacency = [
+                context["eligibility"][assignment["course_id"]]["room_ids"]
+                for assignment in slot_assignments
+            ]
+
+            matching = _hopcroft_karp(adjacency)
+            for idx, assignment in enumerate(slot_assignments):
+                if idx in matching:
+                    assignment["room_id"] = matching[idx]
+                else:
+                    unmatched.append(assignment)
+
+        if not unmatched:
+            return None
+        missing = ", ".join(
+            f"{context['course_by_id'][assignment['course_id']].code} ({assignment['group']}) in slot {assignment['slot_id']}"
+            for assignment in unmatched
+        )
+        return f"No free room for {missing}. Try room_assignment 'ilp'."
+
+    def _with_room_choices(self, session_candidates):
+        """Expand room-less candidates into one plain candidate per eligible room for the GA"""
+        expanded = {}
+        result = {}
+        for session_id, candidates in session_candidates.items():
+            key = id(candidates)
+            if key not in expanded:
+                expanded[key] = [
+                    {**{k: v for k, v in candidate.items() if k != "var"}, "room_id": room_id}
+                    for candidate in candidates
+                    for room_id in sorted(candidate["room_class"])
+                ]
+            result[session_id] = expanded[key]
+        return result
 
     def _faculty_for_course(self, course: Course, faculty_list: List[Faculty], expertise_map):
         """Constraint 4 & 8: Select faculty based on expertise"""
@@ -593,44 +2580,176 @@ class TimetableGenerator:
     # --------------------------------------------------------------------- #
     # Genetic Optimizer (Constraints 5-8)
     # --------------------------------------------------------------------- #
+    # Refiners selectable through config['refiner']; a callable with the
+    # signature refiner(generator, context, base_assignments, session_candidates)
+    # returning {"assignments": [...], "warnings": [...]} is accepted as well.
+    REFINERS = {
+        "ga": "_refine_with_genetic_algorithm",
+        "tabu": "_refine_with_tabu_search",
+        "annealing": "_refine_with_simulated_annealing",
+    }
+
+    def _refine(self, context, base_assignments, session_candidates):
+        refiner = self.config.get('refiner', 'ga')
+        if callable(refiner):
+            result = refiner(self, context, base_assignments, session_candidates)
+        else:
+            method = self.REFINERS.get(refiner)
+            if method is None:
+                return {"warnings": [f"⚠️ Unknown refiner '{refiner}' – keeping ILP assignments."]}
+            result = getattr(self, method)(context, base_assignments, session_candidates)
+
+        # Soft-constraint gains never pay for new clashes
+        refined = result.get("assignments")
+        if refined is not None and self._clashes(refined, context) > self._clashes(base_assignments, context):
+            result = dict(result)
+            del result["assignments"]
+            result["warnings"] = list(result.get("warnings", [])) + [
+                "⚠️ Refinement introduced clashes – keeping ILP assignments."
+            ]
+        return result
+
+    def _refine_with_tabu_search(self, context, base_assignments, session_candidates):
+        """Tabu search over relocation, swap and Kempe-chain moves"""
+        return self._refine_with_local_search(context, base_assignments, session_candidates, "tabu")
+
+    def _refine_with_simulated_annealing(self, context, base_assignments, session_candidates):
+        """Simulated annealing over relocation, swap and Kempe-chain moves"""
+        return self._refine_with_local_search(context, base_assignments, session_candidates, "annealing")
+
+    def _refine_with_local_search(self, context, base_assignments, session_candidates, method):
+        if not base_assignments:
+            return {"warnings": [f"{method.title()} refinement skipped – no ILP assignments to refine."]}
+
+        candidates_by_session = self._index_assignment_candidates(session_candidates)
+        session_ids, position_candidates, base_genes = self._encode_chromosome(base_assignments, candidates_by_session)
+        search = _LocalSearch(self._fitness_tables(context), position_candidates, base_genes, self.random.getrandbits(63))
+        deadline = time.time() + self.refiner_time_limit if self.refiner_time_limit else None
+        search.stop = self._accepted
+        if method == "tabu":
+            search.tabu_search(self.refiner_iterations, deadline, self.tabu_tenure, self.tabu_sample_size)
+        else:
+            search.anneal(
+                self.refiner_iterations, deadline,
+                self.annealing_start_temperature, self.annealing_end_temperature,
+            )
+        self._emit("refine", iterations=search.iterations, best_fitness=search.best_penalty)
+        return {
+            "assignments": self._decode_chromosome(search.best_genes, session_ids, position_candidates),
+            "warnings": [],
+            "stats": {"iterations": search.iterations, "best_fitness": search.best_penalty},
+        }
+
     def _refine_with_genetic_algorithm(self, context, base_assignments, session_candidates):
         """Enhanced GA with consecutive lecture prevention and multi-course handling"""
         if not base_assignments:
             return {"warnings": ["GA skipped – no ILP assignments to refine."]}
 
-        population_size = 10
-        generations = 15
         candidates_by_session = self._index_assignment_candidates(session_candidates)
+        session_ids, position_candidates, base_genes = self._encode_chromosome(base_assignments, candidates_by_session)
+        engine = _GeneticEngine(
+            self._fitness_tables(context),
+            position_candidates,
+            self.ga_population_size,
+            self.ga_tournament_size,
+            self.ga_elitism,
+            repair=self.ga_repair,
+        )
+        base_state = engine.score(base_genes)
+
+        # Individuals keep running tallies so mutation, crossover and repair
+        # re-score only the genes they change. With `ga_island_processes` each
+        # island evolves in its own worker between migrations; the engine
+        # (tables and candidates) is shipped to each worker once.
+        island_processes = self.ga_island_processes and self.ga_islands > 1
+        executor = None
+        if island_processes:
+            executor = ProcessPoolExecutor(
+                max_workers=self.ga_islands,
+                initializer=_init_ga_worker,
+                initargs=(engine,),
+            )
 
-        def clone(assignments):
-            return [assignment.copy() for assignment in assignments]
-
-        population = [clone(base_assignments)]
-        while len(population) < population_size:
-            mutated = self._mutate_assignment(population[0], candidates_by_session)
-            population.append(mutated)
+        deadline = time.time() + self.ga_time_limit if self.ga_time_limit else None
+        generation = 0
+        try:
+            base = (base_state.penalty, base_genes, base_state)
+            islands = []
+            for _ in range(self.ga_islands):
+                bred = []
+                for _ in range(self.ga_population_size - 1):
+                    state = base_state.copy()
+                    bred.append((engine.mutate(base_genes, self.random, state), state))
+                islands.append([base] + engine.rate(bred))
+
+            best = base
+            stale = 0
+            while generation < self.ga_generations:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                if self._accepted.is_set():
+                    break
+                epoch = min(self.ga_migration_interval, self.ga_generations - generation)
+                # Fresh seeds per island and epoch keep runs reproducible for a given
+                # random_seed whether islands evolve in-process or in workers
+                seeds = [self.random.getrandbits(63) for _ in islands]
+                if island_processes:
+                    futures = [
+                        executor.submit(_evolve_island, island, epoch, seed, deadline)
+                        for island, seed in zip(islands, seeds)
+                    ]
+                    results = [future.result() for future in futures]
+                else:
+                    results = [
+                        engine.evolve(island, epoch, seed, deadline)
+                        for island, seed in zip(islands, seeds)
+                    ]
+                islands = [population for population, _ in results]
+                ran = max(count for _, count in results)
+                if not ran:
+                    break
+                generation += ran
+
+                epoch_best = min((min(island, key=lambda ind: ind[0]) for island in islands), key=lambda ind: ind[0])
+                if epoch_best[0] < best[0]:
+                    best = epoch_best
+                    stale = 0
+                else:
+                    stale += ran
+                self._emit("refine", generation=generation, best_fitness=best[0])
+                if self.ga_patience and stale >= self.ga_patience:
+                    break
+                self._migrate(islands)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
-        for _ in range(generations):
-            scored = sorted(
-                [(self._fitness(individual, context), individual) for individual in population],
-                key=lambda item: item[0],
-            )
-            population = [ind for _, ind in scored[:population_size // 2]]
-            while len(population) < population_size:
-                parents = self.random.sample(population[: max(1, len(population) // 2)], k=min(2, len(population)))
-                child = self._crossover_assignments(*parents)
-                child = self._mutate_assignment(child, candidates_by_session)
-                population.append(child)
+        return {
+            "assignments": self._decode_chromosome(best[1], session_ids, position_candidates),
+            "warnings": [],
+            "stats": {"generations": generation, "islands": len(islands), "best_fitness": best[0]},
+        }
 
-        best = min(population, key=lambda individual: self._fitness(individual, context))
-        return {"assignments": best, "warnings": []}
+    def _migrate(self, islands):
+        """Ring migration: each island's elites replace the worst individuals of the next island"""
+        if len(islands) < 2 or not self.ga_migration_size:
+            return
+        for island in islands:
+            island.sort(key=lambda individual: individual[0])
+        emigrants = [island[:self.ga_migration_size] for island in islands]
+        for idx, migrants in enumerate(emigrants):
+            target = islands[(idx + 1) % len(islands)]
+            keep = max(1, len(target) - len(migrants))
+            target[keep:] = migrants[:len(target) - keep]
 
     def _index_assignment_candidates(self, session_candidates):
-        index = defaultdict(list)
+        """Strip solver fields; sessions sharing a candidate list also share the stripped list"""
+        index = {}
+        stripped = {}
         for session_id, candidates in session_candidates.items():
-            for candidate in candidates:
-                index[session_id].append({
-                    "session_id": session_id,
+            key = id(candidates)
+            if key not in stripped:
+                stripped[key] = [{
                     "faculty_id": candidate["faculty_id"],
                     "room_id": candidate["room_id"],
                     "slot_id": candidate["slot_id"],
@@ -638,110 +2757,78 @@ class TimetableGenerator:
                     "course_id": candidate["course_id"],
                     "course_code": candidate["course_code"],
                     "is_lab": candidate["is_lab"],
-                })
+                } for candidate in candidates]
+            index[session_id] = stripped[key]
         return index
 
-    def _mutate_assignment(self, assignments, candidates_by_session):
-        mutated = [assignment.copy() for assignment in assignments]
-        if not mutated:
-            return mutated
-        target = self.random.choice(mutated)
-        session_candidates = candidates_by_session.get(target["session_id"], [])
-        if not session_candidates:
-            return mutated
-        replacement = self.random.choice(session_candidates)
-        target.update(replacement)
-        return mutated
-
-    def _crossover_assignments(self, parent_a, parent_b=None):
-        if parent_b is None:
-            return [assignment.copy() for assignment in parent_a]
-        child = []
-        for a, b in zip(parent_a, parent_b):
-            child.append(a.copy() if self.random.random() < 0.5 else b.copy())
-        return child
+    def _encode_chromosome(self, assignments, candidates_by_session):
+        """
+        Encode assignments as one candidate index per session.
 
-    def _fitness(self, assignments, context):
-        """Enhanced fitness with all constraint penalties"""
-        penalty = 0
-        faculty_hours = defaultdict(int)
-        faculty_daily_hours = defaultdict(lambda: defaultdict(int))
-        group_day_labs = defaultdict(int)
-        group_daily_hours = defaultdict(lambda: defaultdict(int))
-        slot_lookup = context["slot_by_id"]
+        Returns the session id and candidate list of every gene position plus the
+        int32 gene array of the given assignments.
+        """
+        session_ids = []
+        position_candidates = []
+        genes = np.zeros(len(assignments), dtype=np.int32)
+        lookups = {}
+        for position, assignment in enumerate(assignments):
+            candidates = candidates_by_session.get(assignment["session_id"]) or []
+            key = id(candidates)
+            if key not in lookups:
+                lookups[key] = {
+                    (c["faculty_id"], c["room_id"], c["slot_id"]): idx for idx, c in enumerate(candidates)
+                }
+            gene = lookups[key].get((assignment["faculty_id"], assignment["room_id"], assignment["slot_id"]))
+            if gene is None:
+                # Not among the indexed candidates: give this position its own list
+                current = {k: v for k, v in assignment.items() if k != "session_id"}
+                candidates = candidates + [current]
+                gene = len(candidates) - 1
+            session_ids.append(assignment["session_id"])
+            position_candidates.append(candidates)
+            genes[position] = gene
+        return session_ids, position_candidates, genes
+
+    def _decode_chromosome(self, genes, session_ids, position_candidates):
+        return [
+            {"session_id": session_id, **candidates[gene]}
+            for session_id, candidates, gene in zip(session_ids, position_candidates, genes.tolist())
+        ]
 
-        faculty_conflicts = set()
-        room_conflicts = set()
-        group_conflicts = set()
+    def _fitness_tables(self, context):
+        """Immutable lookups shared by every `_FitnessState` of one run"""
+        group_limit = context.get('max_periods_per_day_per_group', None) or 0
+        return {
+            "slot_ordinal": context["slot_ordinal"],
+            "slot_day": [slot.day for slot in context["time_slots"]],
+            "adjacent_slot_mask": context["adjacent_slot_mask"],
+            "faculty_bounds": {
+                f.id: (f.min_hours_per_week, f.max_hours_per_week) for f in context["faculty"]
+            },
+            "group_names": frozenset(group.name for group in context["student_groups"]),
+            "max_per_day": group_limit,
+            "consecutive_weight": 10 * self.consecutive_penalty_weight,
+        }
 
+    def _clashes(self, assignments, context):
+        """Extra bookings of faculty, room or group slots"""
+        state = _FitnessState(self._fitness_tables(context))
         for assignment in assignments:
-            faculty_hours[assignment["faculty_id"]] += 1
-            slot = slot_lookup[assignment["slot_id"]]
-            faculty_daily_hours[assignment["faculty_id"]][slot.day] += 1
-            group_daily_hours[assignment["group"]][slot.day] += 1
-            if assignment["is_lab"]:
-                group_day_labs[(assignment["group"], slot.day)] += 1
-
-            faculty_key = (assignment["faculty_id"], slot.id)
-            room_key = (assignment["room_id"], slot.id)
-            group_key = (assignment["group"], slot.id)
-            if faculty_key in faculty_conflicts or room_key in room_conflicts or group_key in group_conflicts:
-                penalty += 100
-            faculty_conflicts.add(faculty_key)
-            room_conflicts.add(room_key)
-            group_conflicts.add(group_key)
-
-        # Constraint 1: Workload bounds penalty
-        for faculty in context["faculty"]:
-            hours = faculty_hours.get(faculty.id, 0)
-            if hours < faculty.min_hours_per_week:
-                penalty += (faculty.min_hours_per_week - hours) * 15
-            if hours > faculty.max_hours_per_week:
-                penalty += (hours - faculty.max_hours_per_week) * 15
+            state.add(assignment)
+        return state.clashes
 
-        # Constraint 2: Lab requirement penalty
-        for group in context["student_groups"]:
-            labs = sum(group_day_labs.get((group.name, day), 0) for day in context["slots_by_day"].keys())
-            if labs == 0:
-                penalty += 30
-
-        # Constraint X: Group per-day maximum penalty
-        max_per_day = context.get('max_periods_per_day_per_group', None)
-        if max_per_day:
-            for group_name, daily in group_daily_hours.items():
-                for day, hours in daily.items():
-                    if hours > max_per_day:
-                        penalty += (hours - max_per_day) * 20
-
-        # Constraint 5: Consecutive lecture penalty (major enhancement)
-        penalty += self._consecutive_penalty(assignments, context) * self.consecutive_penalty_weight
-
-        # Constraint 7: Daily balance penalty
-        for faculty_id, daily_hours in faculty_daily_hours.items():
-            for day, hours in daily_hours.items():
-                if hours > 6:  # More than 6 hours in a day
-                    penalty += (hours - 6) * 5
-
-        return penalty
-
-    def _consecutive_penalty(self, assignments, context):
-        """Constraint 5: Heavily penalize consecutive lectures of same subject"""
-        penalty = 0
-        slot_lookup = context["slot_by_id"]
-        grouped = defaultdict(list)
-        
+    def _double_booked_group_slots(self, assignments):
+        """Extra bookings of a student group in one slot (which the stored timetable cannot hold)"""
+        bookings = Counter((assignment["slot_id"], assignment["group"]) for assignment in assignments)
+        return sum(count - 1 for count in bookings.values() if count > 1)
+
+    def _fitness(self, assignments, context):
+        """Enhanced fitness with all constraint penalties"""
+        state = _FitnessState(self._fitness_tables(context))
         for assignment in assignments:
-            slot = slot_lookup[assignment["slot_id"]]
-            key = (assignment["group"], assignment["course_code"], slot.day)
-            grouped[key].append(slot)
-
-        for slots in grouped.values():
-            slots.sort(key=lambda s: s.period)
-            for first, second in zip(slots, slots[1:]):
-                if second.period == first.period + 1:
-                    penalty += 10  # Heavy penalty for consecutive same subject
-        
-        return penalty
+            state.add(assignment)
+        return state.penalty
 
     # --------------------------------------------------------------------- #
     # Enhanced Features (Constraints 7, 9)
@@ -796,17 +2883,17 @@ class TimetableGenerator:
     # Persistence
     # --------------------------------------------------------------------- #
     def _persist_assignments(self, assignments, context):
-        entries_created = 0
-        for assignment in assignments:
-            entry = TimetableEntry(
+        # Swap the whole timetable in one step once the new one exists, so a
+        # failure part-way leaves the previous timetable in place
+        entries = [
+            TimetableEntry(
                 course_id=assignment["course_id"],
                 faculty_id=assignment["faculty_id"],
                 room_id=assignment["room_id"],
                 time_slot_id=assignment["slot_id"],
                 student_group=assignment["group"],
             )
-            self.db.session.add(entry)
-            entries_created += 1
-
-        self.db.session.commit()
-        return entries_created
+            for assignment in assignments
+        ]
+        self.db.replace_all(TimetableEntry, entries)
+        return len(entries)
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+
+# mongomock's bulk builder predates the `sort` / `namespace` arguments newer
+# pymongo passes to it
+import mongomock.collection as _mongomock_collection  # noqa: E402
+
+for _name in ('add_replace', 'add_delete', 'add_update'):
+    def _drop_new_kwargs(self, *args, _original=getattr(_mongomock_collection.BulkOperationBuilder, _name), **kwargs):
+        kwargs.pop('sort', None)
+        kwargs.pop('namespace', None)
+        return _original(self, *args, **kwargs)
+    setattr(_mongomock_collection.BulkOperationBuilder, _name, _drop_new_kwargs)
+
+
+@pytest.fixture
+def database():
+    """An empty in-memory database behind `models.db`"""
+    client = mongomock.MongoClient()
+    models.db.client = client
+    models.db._db = client['timetable_test']
+    models.db.session = models._Session(models.db._db)
+    return models.db
+
+
+@pytest.fixture
+def app_module(monkeypatch, database):
+    """app_with_navigation on the test database, with its job worker held back"""
+    if 'app_with_navigation' not in sys.modules:
+        # Importing the app connects and seeds; keep that in memory too
+        monkeypatch.setattr(models, 'MongoClient', lambda *args, **kwargs: mongomock.MongoClient())
+        import app_with_navigation  # noqa: F401
+        models.db._db = database._db
+        models.db.session = database.session
+        models.db.client = database.client
+    app_module = sys.modules['app_with_navigation']
+    monkeypatch.setattr(app_module.generation_queue, 'start', lambda: None)
+    return app_module
@@ -0,0 +1,44 @@
+import json
+
+from jobs import INCREMENTAL, QUEUED
+from models import Faculty, GenerationJob, TimetableEntry, User
+
+
+def _teacher_client(app_module, database):
+    user = User(username='teacher', email='teacher@college.edu', role='teacher')
+    database.session.add(user)
+    database.session.commit()
+    faculty = Faculty(name='Teacher', user_id=user.id, availability='{}')
+    database.session.add(faculty)
+    database.session.add(TimetableEntry(course_id=1, faculty_id=1, room_id=1, time_slot_id=1, student_group='CSE-1'))
+    database.session.commit()
+    client = app_module.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user.id
+    return client, faculty
+
+
+def test_own_availability_is_saved_and_repair_job_queued(app_module, database):
+    client, faculty = _teacher_client(app_module, database)
+    # Default period config: 8 periods on 5 days, at least 70% needed
+    availability = {day: list(range(1, 7)) for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday')}
+
+    response = client.post('/faculty/availability', json={'availability': availability})
+
+    body = response.get_json()
+    assert response.status_code == 200 and body['success']
+    assert json.loads(Faculty.query.get(faculty.id).availability) == availability
+    job = GenerationJob.query.get(body['timetable_repair_job'])
+    assert job.status == QUEUED
+    assert job.kind == INCREMENTAL
+    assert job.params == {'faculty_ids': [faculty.id]}
+
+
+def test_rejected_availability_is_not_saved(app_module, database):
+    client, faculty = _teacher_client(app_module, database)
+
+    response = client.post('/faculty/availability', json={'availability': {'Monday': [1]}})
+
+    assert response.status_code == 400
+    assert Faculty.query.get(faculty.id).availability == '{}'
+    assert GenerationJob.query.count() == 0
@@ -0,0 +1,95 @@
+import random
+import threading
+import time
+
+import pulp
+import pytest
+
+from scheduler import _CbcBackend, _SolveMonitor
+
+cbc = _CbcBackend()
+pytestmark = pytest.mark.skipif(not cbc.available(), reason="CBC is not available")
+
+
+def _market_split(m=4, n=40, seed=1):
+    """Minimise the slack of m random equal-split rows: good incumbents come fast, proving 0 takes CBC long"""
+    rng = random.Random(seed)
+    problem = pulp.LpProblem("market_split", pulp.LpMinimize)
+    x = [pulp.LpVariable(f"x{j}", cat="Binary") for j in range(n)]
+    slack = []
+    for i in range(m):
+        coefficients = [rng.randrange(100) for _ in range(n)]
+        over = pulp.LpVariable(f"over{i}", lowBound=0)
+        under = pulp.LpVariable(f"under{i}", lowBound=0)
+        problem += pulp.lpSum(c * v for c, v in zip(coefficients, x)) + over - under == sum(coefficients) // 2
+        slack += [over, under]
+    problem += pulp.lpSum(slack)
+    return problem
+
+
+def _accepting_monitor(started):
+    """A monitor that accepts the first incumbent and records when each event arrived"""
+    events = []
+    accepted = threading.Event()
+
+    def emit(phase, **data):
+        events.append((time.monotonic() - started, data))
+        if data.get("incumbent") is not None:
+            accepted.set()
+
+    return _SolveMonitor(emit, accepted), events
+
+
+@pytest.mark.skipif(not all(_CbcBackend.live_support().values()), reason="needs stdbuf and /proc")
+def test_live_progress_and_early_accept():
+    started = time.monotonic()
+    monitor, events = _accepting_monitor(started)
+
+    status = cbc.solve(_market_split(), time_limit=20, threads=None, warm_start=False, monitor=monitor)
+
+    # Accepted at the first incumbent, within a second live; a block-buffered log
+    # only reaches the watcher after several seconds, when the buffer fills
+    assert time.monotonic() - started < 4
+    assert pulp.LpStatus[status] == "Optimal"
+    assert any(data.get("incumbent") is not None for _, data in events)
+    assert monitor.notices == []
+
+
+def test_fallback_without_stdbuf_or_proc(monkeypatch):
+    monkeypatch.setattr(_CbcBackend, "live_support", staticmethod(lambda: {"progress": False, "accept": False}))
+
+    def unused(*args):
+        raise AssertionError("live-only machinery used without support")
+
+    monkeypatch.setattr(_CbcBackend, "_line_buffered_path", classmethod(unused))
+    monkeypatch.setattr(_CbcBackend, "_interrupt", unused)
+    monitor, events = _accepting_monitor(time.monotonic())
+    monitor.accepted.set()
+
+    status = cbc.solve(_market_split(), time_limit=2, threads=None, warm_start=False, monitor=monitor)
+
+    # The solve still runs and reports its incumbent, at the latest when it ends
+    assert pulp.LpStatus[status] == "Optimal"
+    assert any(data.get("incumbent") is not None for _, data in events)
+    assert _CbcBackend.no_accept_notice in monitor.notices
+
+
+def test_log_read_only_after_the_solve_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(_CbcBackend, "live_check_after", 0)
+    # One empty read, then the watcher sleeps until the solve is done
+    monkeypatch.setattr(_CbcBackend, "poll_interval", 30)
+    log_path = tmp_path / "cbc.log"
+    log_path.write_text("")
+    monitor, events = _accepting_monitor(time.monotonic())
+    done = threading.Event()
+    watcher = threading.Thread(target=cbc._watch, args=(str(log_path), monitor, done, False))
+    watcher.start()
+
+    time.sleep(0.5)
+    # A buffered log reaches the file only as CBC exits
+    log_path.write_text("Cbc0012I Integer solution of 12 found by feasibility pump after 0 iterations\n")
+    done.set()
+    watcher.join()
+
+    assert [data["incumbent"] for _, data in events] == [12.0]
+    assert monitor.notices == [_CbcBackend.no_progress_notice]
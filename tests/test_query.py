@@ -0,0 +1,30 @@
+import pytest
+
+from models import Condition, TimetableEntry
+
+
+def test_column_comparisons_build_conditions():
+    condition = (TimetableEntry.room_id == 3) & (TimetableEntry.time_slot_id != 5)
+
+    assert isinstance(condition, Condition)
+    assert condition.document == {'$and': [{'room_id': 3}, {'time_slot_id': {'$ne': 5}}]}
+
+
+@pytest.mark.parametrize('condition', [
+    TimetableEntry.room_id == 3,
+    TimetableEntry.room_id != 3,
+    TimetableEntry.room_id.in_([1, 2]),
+])
+def test_conditions_have_no_truth_value(condition):
+    with pytest.raises(TypeError):
+        bool(condition)
+
+
+def test_filter_pushes_conditions_down(database):
+    for slot_id, room_id in ((1, 1), (1, 2), (2, 1)):
+        database.session.add(TimetableEntry(time_slot_id=slot_id, room_id=room_id, student_group='CSE-1'))
+    database.session.commit()
+
+    rows = TimetableEntry.query.filter(TimetableEntry.time_slot_id == 1, TimetableEntry.room_id != 1).all()
+
+    assert [(row.time_slot_id, row.room_id) for row in rows] == [(1, 2)]